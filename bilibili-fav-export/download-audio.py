@@ -0,0 +1,250 @@
+#! /usr/bin/python
+
+"""
+下载收藏夹中视频的音频
+
+对每个 bv_id 只下载 DASH 音频流，不需要下载视频再提取音频；用 ffmpeg 不重新编码地封装为 m4a，
+并写入标题。下载在有上限的异步任务池中进行，未完成的下载保存为 .part 文件，
+再次运行时通过 Range 请求从中断处继续。输出目录中已有的视频会被跳过。
+
+API document:
+  https://github.com/SocialSisterYi/bilibili-API-collect/blob/master/docs/video/info.md
+  https://github.com/SocialSisterYi/bilibili-API-collect/blob/master/docs/video/videostream_url.md
+
+用法:
+    python3 download-audio.py merged.sqlite [--source collection-ID] [--output 目录] [--jobs N]
+    python3 download-audio.py --bv BV1xx411c7mD BV1yy411c7mE
+
+本地测试可以先运行 standin.py，再加上 --api http://127.0.0.1:8000。
+"""
+
+import os
+import re
+import sys
+import random
+import asyncio
+import argparse
+import aiohttp
+from typing import List, Optional, Set, Tuple
+
+
+API_BASE = 'https://api.bilibili.com'
+HEADERS = {'User-Agent': 'curl/8.6.0', 'Referer': 'https://www.bilibili.com'}
+DEFAULT_CONCURRENCY = 4
+CHUNK_SIZE = 1024 * 1024
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+
+# 请求过于频繁时返回的 HTTP 状态码和接口 code
+RATE_LIMIT_STATUS = {412, 429}
+RATE_LIMIT_CODES = {-412, -509, -799}
+# fnval=16: DASH 格式
+FNVAL_DASH = 16
+
+_PATTERN_BV_ID = re.compile(r'\[(BV\w+)\]\.m4a$')
+
+
+class IncompleteDownload(Exception):
+    pass
+
+
+def safe_filename(title: str) -> str:
+    title = re.sub(r'[/\\\0]', '_', title).strip()
+    return title[:150] or 'untitled'
+
+
+def output_name(bv_id: str, title: str) -> str:
+    return f'{safe_filename(title)} [{bv_id}].m4a'
+
+
+def downloaded_ids(output: str) -> Set[str]:
+    """输出目录中已有的视频，文件名以 [bv_id].m4a 结尾"""
+    return {m.group(1) for m in map(_PATTERN_BV_ID.search, os.listdir(output)) if m}
+
+
+async def get_json(session: aiohttp.ClientSession, path: str, params: dict) -> dict:
+    """GET 一个接口，被限流时按指数退避重试"""
+    for attempt in range(MAX_RETRIES + 1):
+        async with session.get(API_BASE + path, params=params) as response:
+            if response.status not in RATE_LIMIT_STATUS:
+                response.raise_for_status()
+                body = await response.json(content_type=None)
+                if body.get('code') not in RATE_LIMIT_CODES:
+                    if body.get('code') != 0:
+                        raise Exception(f'{path}: {body.get("code")} {body.get("message")}')
+                    return body['data']
+        if attempt < MAX_RETRIES:
+            await asyncio.sleep(BACKOFF_SECONDS * 2 ** attempt + random.uniform(0, BACKOFF_SECONDS))
+    raise Exception(f'{path}: still rate limited after {MAX_RETRIES} retries')
+
+
+async def audio_stream(session: aiohttp.ClientSession, bv_id: str) -> Tuple[str, List[str]]:
+    """
+    查询视频（第一个分 P）码率最高的音频流
+
+    Returns:
+        (视频标题, [音频流地址, 备用地址, ...])
+    """
+    view = await get_json(session, '/x/web-interface/view', {'bvid': bv_id})
+    play = await get_json(session, '/x/player/playurl', {'bvid': bv_id, 'cid': view['cid'], 'fnval': FNVAL_DASH})
+    audios = (play.get('dash') or {}).get('audio') or []
+    if not audios:
+        raise Exception('no DASH audio stream')
+    best = max(audios, key=lambda a: a.get('bandwidth', 0))
+    urls = [best.get('baseUrl') or best.get('base_url')]
+    urls += best.get('backupUrl') or best.get('backup_url') or []
+    return view['title'], [url for url in urls if url]
+
+
+async def fetch(session: aiohttp.ClientSession, url: str, part_path: str) -> None:
+    """下载到 part_path，已有部分内容时用 Range 请求继续"""
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+    async with session.get(url, headers=headers) as response:
+        content_range = response.headers.get('Content-Range', '')
+        total = int(content_range.rsplit('/', 1)[1]) if content_range.rsplit('/', 1)[-1].isdigit() else None
+        if response.status == 416 and offset:
+            # 上次已经下载完整，只是没来得及封装
+            if total == offset:
+                return
+            # .part 比服务器上的文件还长（过期或损坏），删除后从头下载
+            os.remove(part_path)
+            raise IncompleteDownload(f'{offset} bytes, {total} on server')
+        if response.status == 206 and content_range.startswith(f'bytes {offset}-'):
+            mode = 'ab'
+        elif response.status == 200:
+            # 服务器不支持 Range，从头下载
+            mode, offset = 'wb', 0
+            total = response.content_length
+        else:
+            response.raise_for_status()
+            raise IncompleteDownload(f'unexpected response {response.status} {content_range}')
+
+        with open(part_path, mode) as f:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                f.write(chunk)
+                offset += len(chunk)
+
+    if total is not None and offset != total:
+        raise IncompleteDownload(f'{offset} of {total} bytes')
+
+
+async def remux(part_path: str, target: str, title: str) -> None:
+    """不重新编码，封装为 m4a 并写入标题；先写入临时文件，完成后再重命名"""
+    temp_path = target + '.tmp'
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-v', 'error', '-y', '-i', part_path, '-vn', '-c:a', 'copy',
+        '-metadata', f'title={title}', '-f', 'mp4', temp_path,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise Exception(f'ffmpeg: {stderr.decode(errors="replace").strip()}')
+    os.replace(temp_path, target)
+    os.remove(part_path)
+
+
+async def download_one(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                       bv_id: str, title: Optional[str], output: str) -> Optional[str]:
+    """
+    下载一个视频的音频
+
+    Returns:
+        输出文件路径
+    """
+    part_path = os.path.join(output, f'.{bv_id}.m4s.part')
+    async with semaphore:
+        api_title, urls = await audio_stream(session, bv_id)
+        title = title or api_title
+
+        for attempt in range(MAX_RETRIES + 1):
+            # 依次尝试主地址和备用地址，每次都从已下载的位置继续
+            url = urls[attempt % len(urls)]
+            try:
+                await fetch(session, url, part_path)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError, IncompleteDownload) as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                print(f'{bv_id}: {e}, retrying')
+                await asyncio.sleep(BACKOFF_SECONDS * 2 ** attempt)
+
+    target = os.path.join(output, output_name(bv_id, title))
+    await remux(part_path, target, title)
+    return target
+
+
+async def download_all(items: List[Tuple[str, Optional[str]]], output: str,
+                       concurrency: int = DEFAULT_CONCURRENCY) -> Tuple[int, int]:
+    """
+    Args:
+        items: [(bv_id, 标题)]，标题为 None 时使用视频当前的标题
+
+    Returns:
+        (成功数, 失败数)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency * 2)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60)
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
+        tasks = [download_one(session, semaphore, bv_id, title, output) for bv_id, title in items]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    succeeded = failed = 0
+    for (bv_id, _), result in zip(items, results):
+        if isinstance(result, BaseException):
+            print(f'{bv_id}: error: {result}')
+            failed += 1
+        else:
+            print(f'{bv_id}: {result}')
+            succeeded += 1
+    return succeeded, failed
+
+
+def load_items(db: str, source: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+    """从 merge.py 的数据库读取视频，跳过已失效的视频"""
+    from merge import MergedStore
+
+    store = MergedStore(db)
+    items = [(bv_id, title) for bv_id, title, _, _, invalid, _, _ in store.videos(source) if not invalid]
+    store.close()
+    return items
+
+
+def main():
+    global API_BASE
+
+    parser = argparse.ArgumentParser(description='下载收藏夹中视频的音频')
+    parser.add_argument('db', nargs='?', help='merge.py 的数据库')
+    parser.add_argument('--source', help='只下载该收藏夹中的视频')
+    parser.add_argument('--bv', nargs='+', default=[], help='直接指定 bv_id')
+    parser.add_argument('--output', default='.', help='输出目录')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_CONCURRENCY, help='同时进行的下载数')
+    parser.add_argument('--api', default=API_BASE, help='接口地址（测试时指向 standin.py）')
+    args = parser.parse_args()
+
+    if not args.db and not args.bv:
+        parser.error('需要指定数据库或 --bv')
+    API_BASE = args.api.rstrip('/')
+
+    items = [(bv_id, None) for bv_id in args.bv]
+    if args.db:
+        items += load_items(args.db, args.source)
+
+    os.makedirs(args.output, exist_ok=True)
+    existing = downloaded_ids(args.output)
+    pending = [(bv_id, title) for bv_id, title in dict(items).items() if bv_id not in existing]
+    print(f'{len(items)} 个视频，已下载 {len(items) - len(pending)} 个，需要下载 {len(pending)} 个')
+    if not pending:
+        return
+
+    succeeded, failed = asyncio.run(download_all(pending, args.output, args.jobs))
+    print(f'下载完成 {succeeded} 个，失败 {failed} 个')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
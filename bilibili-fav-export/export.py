@@ -4,9 +4,38 @@
 API document: https://github.com/SocialSisterYi/bilibili-API-collect/blob/master/docs/fav/list.md
 """
 
-import requests 
-from typing import List, Any
+import os
+import csv
+import math
+import json
+import time
+import random
+import sqlite3
+import requests
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+
+API_BASE = 'https://api.bilibili.com'
+PAGE_SIZE = 20  # 接口允许的最大值
+DEFAULT_CONCURRENCY = 4
+TIMEOUT = 10
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+
+# 请求过于频繁时返回的 HTTP 状态码和接口 code
+RATE_LIMIT_STATUS = {412, 429}
+RATE_LIMIT_CODES = {-412, -509, -799}
+
+# 失效视频的标题会被替换为这个字符串
+INVALID_TITLE = '已失效视频'
+
+# 每次批量查询视频详情的视频数，以及详情缓存的有效期
+DETAIL_BATCH_SIZE = 20
+DETAIL_MAX_AGE = 7 * 24 * 3600
+DETAIL_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.detail-cache.sqlite')
 
 
 @dataclass
@@ -15,59 +44,369 @@ class StaredVideo:
     title: str
     introduction: str
     duration: int
+    fav_time: int = 0
+    invalid: bool = False
+    avid: int = 0
+    # 以下由 fill_details 填充
+    owner: str = ''
+    pubdate: int = 0
+    play: int = 0
+    collect: int = 0
+    danmaku: int = 0
 
 
-def export(id: int) -> List[StaredVideo]:
-    def do_map(o: Any) -> StaredVideo:
-        return StaredVideo(bv_id=o['bv_id'],
-                        duration=o['duration'],
-                        introduction='',
-                        title=o['title'])
+class RateLimited(Exception):
+    pass
 
-    def query_by_page(id: int, page: int) -> List[StaredVideo]:
-        response = requests.get('https://api.bilibili.com/x/v3/fav/resource/list', 
-                                params={'media_id': id, 'pn': page, 'ps': 20},
-                                headers={'User-Agent': 'curl/8.6.0'})
-        response.raise_for_status()
 
-        try:
-            video_list = response.json()['data']['medias'] or []
-        except:
-            print(f'Server returned text: {response.text}')
-            return []
-        
-        return [do_map(e) for e in video_list]
-    
-    result: List[StaredVideo] = []
-    last_size: int = 20
-    last_page: int = 1
-    while last_size == 20:
-        page = query_by_page(id, last_page)
-        result.extend(page)
+def make_session(concurrency: int = DEFAULT_CONCURRENCY) -> requests.Session:
+    """所有请求共用的 keep-alive 会话，连接池大小与并发数一致"""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_maxsize=concurrency))
+    session.mount('http://', HTTPAdapter(pool_maxsize=concurrency))
+    session.headers['User-Agent'] = 'curl/8.6.0'
+    return session
+
+
+def get_json(session: requests.Session, path: str, params: dict) -> Any:
+    """GET 一个接口，被限流时按指数退避重试"""
+    for attempt in range(MAX_RETRIES + 1):
+        response = session.get(API_BASE + path, params=params, timeout=TIMEOUT)
+        if response.status_code not in RATE_LIMIT_STATUS:
+            response.raise_for_status()
+            try:
+                body = response.json()
+            except ValueError:
+                print(f'Server returned text: {response.text}')
+                raise
+            if body.get('code') not in RATE_LIMIT_CODES:
+                return body
+
+        if attempt == MAX_RETRIES:
+            break
+        time.sleep(BACKOFF_SECONDS * 2 ** attempt + random.uniform(0, BACKOFF_SECONDS))
+    raise RateLimited(f'{path} {params}: still rate limited after {MAX_RETRIES} retries')
+
+
+def do_map(o: Any) -> StaredVideo:
+    # attr: 0 正常，1 其他原因删除，9 UP 主删除
+    return StaredVideo(bv_id=o['bv_id'],
+                       duration=o['duration'],
+                       introduction='',
+                       title=o['title'],
+                       fav_time=o.get('fav_time', 0),
+                       invalid=bool(o.get('attr', 0) & 1) or o['title'] == INVALID_TITLE,
+                       avid=o.get('id', 0))
+
+
+def query_page(session: requests.Session, id: int, page: int) -> Dict[str, Any]:
+    """读取一页，返回接口的 data 部分"""
+    body = get_json(session, '/x/v3/fav/resource/list', {'media_id': id, 'pn': page, 'ps': PAGE_SIZE})
+    return body.get('data') or {}
+
+
+def export(id: int, concurrency: int = DEFAULT_CONCURRENCY,
+           session: Optional[requests.Session] = None) -> List[StaredVideo]:
+    """
+    导出一个收藏夹
+
+    先读取第一页得到收藏夹的 media_count，再并发读取其余各页，按页码顺序合并。
+    """
+    if session is None:
+        with make_session(concurrency) as session:
+            return export(id, concurrency, session)
 
-        last_page += 1
-        last_size = len(page)
+    first = query_page(session, id, 1)
+    media_count = (first.get('info') or {}).get('media_count', 0)
+    pages = max(1, math.ceil(media_count / PAGE_SIZE))
 
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        rest = executor.map(lambda page: query_page(session, id, page), range(2, pages + 1))
+        all_pages = [first] + list(rest)
+
+    # 导出期间收藏夹发生变化时，相邻两页可能有重复的视频
+    result: List[StaredVideo] = []
+    seen = set()
+    for data in all_pages:
+        for e in data.get('medias') or []:
+            if e['bv_id'] not in seen:
+                seen.add(e['bv_id'])
+                result.append(do_map(e))
     return result
 
 
-if __name__ == '__main__':
-    import sys
-    import os
+def list_folders(session: requests.Session, mid: int) -> List[Dict[str, Any]]:
+    """用户创建的所有收藏夹 [{'id': ..., 'title': ..., 'media_count': ...}, ...]"""
+    body = get_json(session, '/x/v3/fav/folder/created/list-all', {'up_mid': mid})
+    return (body.get('data') or {}).get('list') or []
+
+
+class DetailCache:
+    """视频详情接口的响应缓存，以 bv_id 为键，超过 DETAIL_MAX_AGE 的响应视为过期"""
+
+    def __init__(self, path: str = DETAIL_CACHE_PATH):
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS details (bv_id TEXT PRIMARY KEY, fetched_at INTEGER, data TEXT)')
+
+    def close(self) -> None:
+        self.db.close()
+
+    def get(self, bv_id: str, max_age: int = DETAIL_MAX_AGE) -> Optional[dict]:
+        row = self.db.execute('SELECT fetched_at, data FROM details WHERE bv_id = ?', (bv_id,)).fetchone()
+        if row and row[0] >= time.time() - max_age:
+            return json.loads(row[1])
+        return None
+
+    def put(self, bv_id: str, data: dict) -> None:
+        self.db.execute('INSERT OR REPLACE INTO details VALUES (?, ?, ?)',
+                        (bv_id, int(time.time()), json.dumps(data, ensure_ascii=False)))
+
+    def commit(self) -> None:
+        self.db.commit()
+
+
+def apply_details(video: StaredVideo, data: dict) -> None:
+    video.introduction = data.get('intro') or video.introduction
+    video.owner = (data.get('upper') or {}).get('name', '')
+    video.pubdate = data.get('pubtime', 0)
+    counts = data.get('cnt_info') or {}
+    video.play = counts.get('play', 0)
+    video.collect = counts.get('collect', 0)
+    video.danmaku = counts.get('danmaku', 0)
+
+
+def query_details(session: requests.Session, batch: List[StaredVideo]) -> List[dict]:
+    """一次请求查询多个视频的简介、UP 主、发布时间和播放数据"""
+    resources = ','.join(f'{v.avid}:2' for v in batch)
+    body = get_json(session, '/x/v3/fav/resource/infos', {'resources': resources, 'platform': 'web'})
+    return body.get('data') or []
+
+
+def fill_details(session: requests.Session, videos: Iterable[StaredVideo], cache: DetailCache,
+                 concurrency: int = DEFAULT_CONCURRENCY) -> int:
+    """
+    填充视频详情
 
-    assert len(sys.argv) == 2
+    缓存中未过期的视频不再请求，其余视频每 DETAIL_BATCH_SIZE 个一批并发查询；失效视频没有详情。
+    某一批查询失败（如重试后仍被限流）时只跳过这一批，其余批次的结果照常写入缓存，下次导出时只需查询失败的批次。
 
-    fav_collection_id = int(sys.argv[1])
-    exported_collection = export(fav_collection_id)
+    Returns:
+        发出的请求数
+    """
+    missing: List[StaredVideo] = []
+    for v in videos:
+        if v.invalid or not v.avid:
+            continue
+        data = cache.get(v.bv_id)
+        if data is None:
+            missing.append(v)
+        else:
+            apply_details(v, data)
 
-    filename = f'collection-{fav_collection_id}'
+    def query(batch: List[StaredVideo]) -> Tuple[List[dict], Optional[Exception]]:
+        try:
+            return query_details(session, batch), None
+        except Exception as e:
+            return [], e
+
+    batches = [missing[i:i + DETAIL_BATCH_SIZE] for i in range(0, len(missing), DETAIL_BATCH_SIZE)]
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for batch, (results, error) in zip(batches, executor.map(query, batches)):
+                if error is not None:
+                    print(f'查询视频详情失败（{batch[0].bv_id} 等 {len(batch)} 个视频）: {error}')
+                    continue
+                by_id = {r.get('bvid') or r.get('bv_id'): r for r in results}
+                for v in batch:
+                    data = by_id.get(v.bv_id)
+                    if data is not None:
+                        cache.put(v.bv_id, data)
+                        apply_details(v, data)
+    finally:
+        cache.commit()
+    return len(batches)
+
+
+class FavoriteStore:
+    """
+    一个收藏夹的本地 SQLite 存储
+
+    视频失效后接口只返回 "已失效视频"，存储中保留失效之前的标题和时长。
+    """
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS videos (
+                bv_id        TEXT PRIMARY KEY,
+                title        TEXT NOT NULL,
+                introduction TEXT NOT NULL DEFAULT '',
+                duration     INTEGER NOT NULL,
+                fav_time     INTEGER NOT NULL,
+                invalid      INTEGER NOT NULL DEFAULT 0,
+                first_seen   INTEGER NOT NULL,
+                last_seen    INTEGER NOT NULL,
+                avid         INTEGER NOT NULL DEFAULT 0
+            )''')
+        # 早期版本创建的存储没有 avid
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(videos)')]
+        if 'avid' not in columns:
+            self.db.execute('ALTER TABLE videos ADD COLUMN avid INTEGER NOT NULL DEFAULT 0')
+
+    def close(self) -> None:
+        self.db.close()
+
+    def known(self) -> Dict[str, bool]:
+        """{bv_id: 是否已失效}"""
+        return {bv_id: bool(invalid) for bv_id, invalid in self.db.execute('SELECT bv_id, invalid FROM videos')}
+
+    def title(self, bv_id: str) -> Optional[str]:
+        row = self.db.execute('SELECT title FROM videos WHERE bv_id = ?', (bv_id,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, videos: List[StaredVideo]) -> None:
+        now = int(time.time())
+        self.db.executemany('''
+            INSERT INTO videos (bv_id, title, introduction, duration, fav_time, invalid, first_seen, last_seen, avid)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (bv_id) DO UPDATE SET
+                title = CASE WHEN excluded.invalid THEN videos.title ELSE excluded.title END,
+                duration = CASE WHEN excluded.invalid THEN videos.duration ELSE excluded.duration END,
+                introduction = CASE WHEN excluded.introduction != '' THEN excluded.introduction
+                                    ELSE videos.introduction END,
+                fav_time = excluded.fav_time,
+                invalid = excluded.invalid,
+                last_seen = excluded.last_seen,
+                avid = CASE WHEN excluded.avid THEN excluded.avid ELSE videos.avid END''',
+            [(v.bv_id, v.title, v.introduction, v.duration, v.fav_time, int(v.invalid), now, now, v.avid)
+             for v in videos])
+        self.db.commit()
+
+    def save_introductions(self, videos: List[StaredVideo]) -> None:
+        """只更新简介，不改变 last_seen 等收藏状态（视频可能已经不在收藏夹中）"""
+        self.db.executemany('UPDATE videos SET introduction = ? WHERE bv_id = ?',
+                            [(v.introduction, v.bv_id) for v in videos])
+        self.db.commit()
+
+    def videos(self) -> List[StaredVideo]:
+        """所有视频，最近收藏的在前"""
+        return [StaredVideo(bv_id, title, introduction, duration, fav_time, bool(invalid), avid)
+                for bv_id, title, introduction, duration, fav_time, invalid, avid in self.db.execute(
+                    'SELECT bv_id, title, introduction, duration, fav_time, invalid, avid FROM videos '
+                    'ORDER BY fav_time DESC, bv_id')]
+
+
+def refresh(id: int, store: FavoriteStore, concurrency: int = DEFAULT_CONCURRENCY,
+            full: bool = False, session: Optional[requests.Session] = None
+            ) -> Tuple[List[StaredVideo], List[StaredVideo]]:
+    """
+    用接口的最新内容更新本地存储
+
+    收藏夹按收藏时间从新到旧排列：增量更新时逐页读取，一页中全部是已知视频时停止。
+    存储为空或 full 为 True 时并发读取全部分页（更早的视频失效只有全量更新才能发现）。
+
+    Returns:
+        (新收藏的视频, 新失效的视频)，失效视频的标题为失效之前的标题
+    """
+    if session is None:
+        with make_session(concurrency) as session:
+            return refresh(id, store, concurrency, full, session)
+
+    known = store.known()
+    if full or not known:
+        fetched = export(id, concurrency, session)
+    else:
+        fetched = []
+        page = 1
+        while True:
+            data = query_page(session, id, page)
+            videos = [do_map(e) for e in data.get('medias') or []]
+            fetched.extend(videos)
+            if not data.get('has_more') or all(v.bv_id in known for v in videos):
+                break
+            page += 1
+
+    added = [v for v in fetched if v.bv_id not in known]
+    invalidated = [v for v in fetched if v.invalid and known.get(v.bv_id) is False]
+    store.save(fetched)
+    for v in invalidated:
+        v.title = store.title(v.bv_id)
+    return added, invalidated
+
+
+def next_filename(base: str, ext: str) -> str:
+    """不覆盖之前的导出：base.ext、base-1.ext、base-2.ext ..."""
     count = 0
-    make_filename = lambda: filename + '.csv' if count == 0 else f'{filename}-{count}.csv'
+    make_filename = lambda: f'{base}.{ext}' if count == 0 else f'{base}-{count}.{ext}'
     while os.path.exists(make_filename()) and count < 100:
         count += 1
+    return make_filename()
+
+
+def write_collection(path: str, videos: List[StaredVideo]) -> None:
+    # 简介中可能有 Tab 和换行，由 csv 模块负责转义
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerows((v.bv_id, v.title, v.introduction, v.duration) for v in videos)
+
+
+CATALOGUE_COLUMNS = ['folder', 'bv_id', 'title', 'owner', 'pubdate', 'duration',
+                     'play', 'collect', 'danmaku', 'invalid', 'introduction']
+
+
+def write_catalogue(path: str, folders: List[Tuple[str, List[StaredVideo]]]) -> None:
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(CATALOGUE_COLUMNS)
+        for folder, videos in folders:
+            writer.writerows((folder, v.bv_id, v.title, v.owner, v.pubdate, v.duration,
+                              v.play, v.collect, v.danmaku, int(v.invalid), v.introduction) for v in videos)
+
+
+def export_collection(id: int, session: requests.Session, cache: DetailCache,
+                      concurrency: int = DEFAULT_CONCURRENCY, full: bool = False) -> List[StaredVideo]:
+    """更新一个收藏夹的存储并填充视频详情，写出 collection-ID.csv"""
+    store = FavoriteStore(f'collection-{id}.sqlite')
+    added, invalidated = refresh(id, store, concurrency, full, session)
+    print(f'收藏夹 {id}: 新收藏 {len(added)} 个视频')
+    for v in invalidated:
+        print(f'已失效: {v.bv_id} {v.title}')
+
+    videos = store.videos()
+    requests_sent = fill_details(session, videos, cache, concurrency)
+    if requests_sent:
+        print(f'收藏夹 {id}: 查询视频详情 {requests_sent} 次')
+    # 简介保存到存储中，详情缓存过期后也不会丢失
+    store.save_introductions([v for v in videos if v.introduction and not v.invalid])
+    store.close()
+
+    write_collection(next_filename(f'collection-{id}', 'csv'), videos)
+    return videos
+
+
+if __name__ == '__main__':
+    import argparse
 
+    parser = argparse.ArgumentParser(description='导出 bilibili 收藏夹')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('media_id', type=int, nargs='?', help='收藏夹 ID')
+    target.add_argument('--mid', type=int, help='导出该用户创建的所有收藏夹')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_CONCURRENCY, help='同时进行的请求数')
+    parser.add_argument('--full', action='store_true', help='重新读取全部分页，而不是只读取新收藏的视频')
+    args = parser.parse_args()
 
-    with open(make_filename(), 'w+') as f:
-        for v in exported_collection:        
-            l = '\t'.join([str(x) for x in v.__dict__.values()]) + '\n'
-            f.write(l)
+    cache = DetailCache()
+    with make_session(args.jobs) as session:
+        if args.mid is None:
+            export_collection(args.media_id, session, cache, args.jobs, args.full)
+        else:
+            folders = list_folders(session, args.mid)
+            print(f'用户 {args.mid} 共有 {len(folders)} 个收藏夹')
+            catalogue = []
+            for folder in folders:
+                videos = export_collection(folder['id'], session, cache, args.jobs, args.full)
+                catalogue.append((folder['title'], videos))
+            path = next_filename(f'account-{args.mid}', 'tsv')
+            write_catalogue(path, catalogue)
+            print(f'已写出 {path}')
+    cache.close()
@@ -1,54 +1,234 @@
-
-
-MUSICS: dict = {}
-
-
-def load_and_merge(file: str) -> int:
-    """
-    Loads a music file and merges it with the current music list.
+#! /usr/bin/python
+
+"""
+合并多次导出的收藏夹
+
+导出结果（export.py 写出的 .csv 或 .sqlite）导入到一个 SQLite 数据库中，以 bv_id 为主键去重，
+记录每个视频第一次和最后一次出现的时间，以及出现在哪些收藏夹中。查询直接在数据库中完成。
+
+用法:
+    python3 merge.py ingest merged.sqlite [文件 ...]    # 不指定文件时导入当前目录下所有导出文件
+    python3 merge.py list merged.sqlite [--source 收藏夹]
+    python3 merge.py diff merged.sqlite A B             # 在 A 中但不在 B 中的视频
+    python3 merge.py sources merged.sqlite
+"""
+
+import io
+import os
+import re
+import csv
+import sys
+import sqlite3
+import argparse
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+INVALID_TITLE = '已失效视频'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS videos (
+    bv_id      TEXT PRIMARY KEY,
+    title      TEXT NOT NULL,
+    introduction TEXT NOT NULL DEFAULT '',
+    duration   INTEGER,
+    invalid    INTEGER NOT NULL DEFAULT 0,
+    first_seen INTEGER NOT NULL,
+    last_seen  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS memberships (
+    source     TEXT NOT NULL,
+    bv_id      TEXT NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen  INTEGER NOT NULL,
+    PRIMARY KEY (source, bv_id)
+);
+CREATE INDEX IF NOT EXISTS memberships_bv_id ON memberships (bv_id);
+CREATE TEMP TABLE staging (
+    bv_id TEXT, title TEXT, introduction TEXT, duration INTEGER, invalid INTEGER,
+    first_seen INTEGER, last_seen INTEGER
+);
+'''
+
+# 同一个视频已有有效的标题时，不会被 "已失效视频" 覆盖
+_MERGE = '''
+INSERT INTO videos (bv_id, title, introduction, duration, invalid, first_seen, last_seen)
+SELECT bv_id, title, introduction, duration, invalid, first_seen, last_seen FROM staging WHERE true
+ON CONFLICT (bv_id) DO UPDATE SET
+    title = CASE WHEN excluded.invalid THEN videos.title ELSE excluded.title END,
+    introduction = CASE WHEN excluded.introduction != '' THEN excluded.introduction ELSE videos.introduction END,
+    duration = CASE WHEN excluded.invalid THEN videos.duration ELSE excluded.duration END,
+    invalid = CASE WHEN excluded.last_seen >= videos.last_seen THEN excluded.invalid ELSE videos.invalid END,
+    first_seen = min(videos.first_seen, excluded.first_seen),
+    last_seen = max(videos.last_seen, excluded.last_seen);
+
+INSERT INTO memberships (source, bv_id, first_seen, last_seen)
+SELECT :source, bv_id, first_seen, last_seen FROM staging WHERE true
+ON CONFLICT (source, bv_id) DO UPDATE SET
+    first_seen = min(memberships.first_seen, excluded.first_seen),
+    last_seen = max(memberships.last_seen, excluded.last_seen);
+
+DELETE FROM staging;
+'''
+
+Row = Tuple[str, str, str, int, int, int, int]  # (bv_id, 标题, 简介, 时长, 是否失效, 第一次出现, 最后一次出现)
+
+
+def source_name(path: str) -> str:
+    """collection-123.csv、collection-123-2.csv 和 collection-123.sqlite 都属于收藏夹 collection-123"""
+    stem = os.path.basename(path).rsplit('.', 1)[0]
+    return re.sub(r'^(collection-\d+)-\d+$', r'\1', stem)
+
+
+def _read_escaped(text: str) -> Optional[List[List[str]]]:
+    """按 csv 转义规则解析，结果不是每行 4 列、最后一列为时长时返回 None"""
+    try:
+        rows = [columns for columns in csv.reader(io.StringIO(text), delimiter='\t', strict=True) if columns]
+    except csv.Error:
+        return None
+    if all(len(columns) == 4 and (columns[3].isdigit() or not columns[3]) for columns in rows):
+        return rows
+    return None
+
+
+def read_tsv(path: str, seen: int) -> Iterator[Row]:
     """
-    global MUSIC_LIST
+    读取 export.py 导出的 TSV
 
-    count: int = 0
-    with open(file, "r") as f:
-        music_list = f.readlines()
-        for line in music_list:
-            if not line:
-                continue
-
-            columns = line.strip().split('\t')
-            bv = columns[0]
-            title = columns[1]
-            length = columns[-1]
-            try:
-                length = int(length)
-            except:
-                pass
+    新版本导出的文件由 csv 模块转义；旧版本导出的文件没有转义，每行一个视频，引号只是普通字符，
+    标题以引号开头时按转义规则解析会吞掉后面的行，因此只有按转义规则解析的结果完全符合格式时才采用。
+    旧文件中简介里的 Tab 会产生多余的列：第一列是 bv_id、第二列是标题、
+    最后一列是时长，中间的都属于简介。
 
-
-            if title == '已失效视频':
-                continue
-
-            MUSICS[bv] = (title, length)
-            count += 1
-
-
-def load_files():
-    """
-    Loads all music files.
+    Args:
+        seen: 文件中所有视频的出现时间（TSV 不记录每个视频的时间，使用文件的修改时间）
     """
-    
-    import os
-
-    for _, _, filenames in os.walk('.'):
-        for filename in [f for f in filenames if f.endswith('.csv')]:
-            load_and_merge(filename)
-
-
-load_files()
+    with open(path, newline='', encoding='utf-8') as f:
+        text = f.read()
+    rows = _read_escaped(text) if '"' in text else None
+    if rows is None:
+        rows = csv.reader(io.StringIO(text), delimiter='\t', quoting=csv.QUOTE_NONE)
+
+    for columns in rows:
+        if len(columns) < 3:
+            continue
+        bv_id, title = columns[0], columns[1]
+        introduction = '\t'.join(columns[2:-1])
+        try:
+            duration = int(columns[-1])
+        except ValueError:
+            duration = None
+        yield bv_id, title, introduction, duration, int(title == INVALID_TITLE), seen, seen
+
+
+def read_store(path: str) -> Iterator[Row]:
+    """读取 export.py 的收藏夹存储，失效视频在存储中保留了原标题，每个视频有各自的出现时间"""
+    db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        yield from db.execute(
+            'SELECT bv_id, title, introduction, duration, invalid, first_seen, last_seen FROM videos')
+    finally:
+        db.close()
+
+
+class MergedStore:
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def ingest(self, path: str, source: str = None) -> int:
+        """导入一个导出文件：存储中保留了每个视频的出现时间，TSV 以文件的修改时间作为出现时间"""
+        if path.endswith('.sqlite'):
+            rows = read_store(path)
+        else:
+            rows = read_tsv(path, int(os.path.getmtime(path)))
+        with self.db:
+            self.db.executemany('INSERT INTO staging VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            count = self.db.execute('SELECT count(*) FROM staging').fetchone()[0]
+            for statement in _MERGE.split(';'):
+                if statement.strip():
+                    self.db.execute(statement, {'source': source or source_name(path)})
+        return count
+
+    def sources(self) -> List[Tuple[str, int]]:
+        return self.db.execute(
+            'SELECT source, count(*) FROM memberships GROUP BY source ORDER BY source').fetchall()
+
+    def videos(self, source: str = None) -> Iterable[tuple]:
+        columns = 'v.bv_id, v.title, v.introduction, v.duration, v.invalid, v.first_seen, v.last_seen'
+        if source is None:
+            return self.db.execute(f'SELECT {columns} FROM videos v ORDER BY v.first_seen, v.bv_id')
+        return self.db.execute(
+            f'SELECT {columns} FROM memberships m JOIN videos v USING (bv_id) '
+            'WHERE m.source = ? ORDER BY v.first_seen, v.bv_id', (source,))
+
+    def difference(self, a: str, b: str) -> Iterable[tuple]:
+        """在收藏夹 a 中但不在收藏夹 b 中的视频"""
+        return self.db.execute(
+            'SELECT v.bv_id, v.title, v.introduction, v.duration, v.invalid, v.first_seen, v.last_seen '
+            'FROM memberships a JOIN videos v USING (bv_id) '
+            'WHERE a.source = ? AND NOT EXISTS '
+            '(SELECT 1 FROM memberships b WHERE b.source = ? AND b.bv_id = a.bv_id) '
+            'ORDER BY v.first_seen, v.bv_id', (a, b))
+
+
+def find_exports(path: str) -> List[str]:
+    files = []
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            if filename.endswith('.csv') or re.match(r'collection-\d+\.sqlite$', filename):
+                files.append(os.path.join(root, filename))
+    return sorted(files)
+
+
+def write_rows(rows: Iterable[tuple]) -> None:
+    writer = csv.writer(sys.stdout, delimiter='\t', lineterminator='\n')
+    writer.writerow(['bv_id', 'title', 'introduction', 'duration', 'invalid', 'first_seen', 'last_seen'])
+    writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合并多次导出的收藏夹')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest = subparsers.add_parser('ingest', help='导入导出文件（.csv 或 .sqlite）')
+    ingest.add_argument('db')
+    ingest.add_argument('files', nargs='*', help='不指定时导入当前目录下所有导出文件')
+    ingest.add_argument('--source', help='收藏夹名称（默认根据文件名确定）')
+
+    listing = subparsers.add_parser('list', help='以 TSV 格式输出视频')
+    listing.add_argument('db')
+    listing.add_argument('--source', help='只输出该收藏夹中的视频')
+
+    diff = subparsers.add_parser('diff', help='在收藏夹 A 中但不在收藏夹 B 中的视频')
+    diff.add_argument('db')
+    diff.add_argument('a')
+    diff.add_argument('b')
+
+    sources = subparsers.add_parser('sources', help='列出收藏夹')
+    sources.add_argument('db')
+
+    args = parser.parse_args()
+    store = MergedStore(args.db)
+
+    if args.command == 'ingest':
+        for path in args.files or find_exports('.'):
+            if os.path.abspath(path) == os.path.abspath(args.db):
+                continue
+            count = store.ingest(path, args.source)
+            print(f'{path}: {count} 个视频')
+    elif args.command == 'list':
+        write_rows(store.videos(args.source))
+    elif args.command == 'diff':
+        write_rows(store.difference(args.a, args.b))
+    else:
+        for source, count in store.sources():
+            print(f'{source}\t{count}')
 
+    store.close()
 
-from pprint import pprint
-MUSICS = [(bv, title, length) for bv, (title, length) in MUSICS.items()]
 
-pprint(MUSICS)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
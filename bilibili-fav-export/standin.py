@@ -0,0 +1,157 @@
+#! /usr/bin/python
+
+"""
+本地 HTTP 测试服务器，代替 bilibili 接口测试 download-audio.py
+
+提供 /x/web-interface/view、/x/player/playurl 两个接口和音频流地址。音频流支持 Range 请求；
+使用 --drop-after 时每个音频流第一次请求只发送指定字节数就断开连接，
+使用 --rate-limit 时每个接口第一次请求返回 HTTP 412，用于测试断点续传和退避重试。
+--audio 指定的文件作为所有视频的音频流，需要是 ffmpeg 能读取的 AAC 音频（如 .m4a、.m4s），
+否则下载后封装会失败。
+
+用法:
+    python3 standin.py --audio 音频文件 [--port 8000] [--drop-after 字节数] [--rate-limit]
+    python3 download-audio.py --bv BV1xx411c7mD --api http://127.0.0.1:8000
+"""
+
+import re
+import json
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+
+DEFAULT_SIZE = 3 * 1024 * 1024
+
+
+def fake_audio(bv_id: str, size: int = DEFAULT_SIZE) -> bytes:
+    """由 bv_id 确定的伪随机内容，下载结果可以和它直接比较；不是有效的音频，只用于测试下载本身"""
+    blocks = []
+    for i in range(0, size, 64):
+        blocks.append(hashlib.blake2b(f'{bv_id}:{i}'.encode()).digest())
+    return b''.join(blocks)[:size]
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # 由 make_server 设置
+    audio: Optional[bytes] = None
+    drop_after: Optional[int] = None
+    rate_limit = False
+    seen: set = set()
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def first_time(self, key: str) -> bool:
+        with self.lock:
+            if key in self.seen:
+                return False
+            self.seen.add(key)
+            return True
+
+    def send_json(self, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        bv_id = query.get('bvid', '')
+
+        if url.path.startswith('/x/') and self.rate_limit and self.first_time(self.path):
+            self.send_response(412)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif url.path == '/x/web-interface/view':
+            self.send_json({'code': 0, 'data': {'bvid': bv_id, 'cid': 1000, 'title': f'标题 {bv_id}'}})
+        elif url.path == '/x/player/playurl':
+            base = f'http://{self.headers["Host"]}/audio/{bv_id}.m4s'
+            self.send_json({'code': 0, 'data': {'dash': {'audio': [
+                {'id': 30216, 'bandwidth': 67000, 'baseUrl': base + '?q=64', 'backupUrl': []},
+                {'id': 30280, 'bandwidth': 320000, 'baseUrl': base, 'backupUrl': [base + '?backup=1']},
+            ]}}})
+        elif url.path.startswith('/audio/'):
+            self.send_audio(url.path[len('/audio/'):].rsplit('.', 1)[0])
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def send_audio(self, bv_id: str) -> None:
+        data = self.audio if self.audio is not None else fake_audio(bv_id)
+        start, status = 0, 200
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        body = data[start:]
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        self.end_headers()
+
+        if self.drop_after is not None and self.first_time(bv_id):
+            # 只发送一部分就断开，模拟下载中断
+            self.wfile.write(body[:self.drop_after])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+def make_server(port: int = 8000, audio: Optional[bytes] = None,
+                drop_after: Optional[int] = None, rate_limit: bool = False) -> ThreadingHTTPServer:
+    """
+    创建测试服务器，可以在其他脚本中用 threading.Thread(target=server.serve_forever) 启动
+
+    Args:
+        audio: 音频流的内容，为 None 时每个视频使用 fake_audio() 生成的内容
+    """
+    handler = type('Handler', (StandinHandler,), {
+        'audio': audio, 'drop_after': drop_after, 'rate_limit': rate_limit,
+        'seen': set(), 'lock': threading.Lock(),
+    })
+    return ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='download-audio.py 的本地测试服务器')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--audio', required=True, help='作为所有视频音频流的 AAC 文件（.m4a 或 .m4s）')
+    parser.add_argument('--drop-after', type=int, help='每个音频流第一次请求只发送的字节数')
+    parser.add_argument('--rate-limit', action='store_true', help='每个接口第一次请求返回 HTTP 412')
+    args = parser.parse_args()
+
+    with open(args.audio, 'rb') as f:
+        audio = f.read()
+
+    server = make_server(args.port, audio, args.drop_after, args.rate_limit)
+    print(f'listening on http://127.0.0.1:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
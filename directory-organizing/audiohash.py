@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+# 脚本需要兼容 Python3.9 (FreeBSD)
+"""
+按音频数据查找重复的录音
+
+同一首歌常有多个副本，音频完全相同，只有标签（广告、封面）和文件名不同，
+整个文件的哈希无法识别。这里只对音频数据计算哈希：
+- FLAC: 元数据块之后的音频帧
+- MP3: 第一个 MPEG 帧（由 mutagen 定位，跳过 ID3v2 标签）
+两者都不包括文件末尾的 APEv2 / ID3v1 标签。
+
+先在进程池中用 mutagen 定位音频数据，按 (格式, 音频数据长度) 分组，
+只有可能重复的文件才读取音频数据，哈希在线程池中并发计算。
+不按时长分组：没有 Xing 头的 CBR MP3 的时长由文件大小估算，包含了末尾的标签，
+只有末尾标签不同的副本时长也不同。
+"""
+
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+import mutagen
+from mutagen.id3 import BitPaddedInt
+from tag import process_pool
+
+
+HASH_CHUNK = 1024 * 1024
+HASH_WORKERS = 8
+# 选择保留的副本时比较的标签，广告通常在注释、网址等其他标签中，不计入
+TAG_FIELDS = ('artist', 'album', 'title', 'albumartist', 'tracknumber', 'discnumber', 'date', 'genre')
+
+# (路径, 格式, 音频数据起始位置, 结束位置, 有内容的标签数, 文件大小)
+Payload = Tuple[str, str, int, int, int, int]
+
+
+def _flac_audio_offset(f) -> int:
+    """跳过（可能存在的）ID3v2 标签和所有元数据块，返回第一个音频帧的位置"""
+    head = f.read(10)
+    offset = 0
+    if head[:3] == b'ID3':
+        offset = 10 + BitPaddedInt(head[6:10])
+    f.seek(offset)
+    if f.read(4) != b'fLaC':
+        raise ValueError('not a FLAC stream')
+
+    offset += 4
+    while True:
+        block = f.read(4)
+        if len(block) < 4:
+            raise ValueError('truncated metadata block')
+        offset += 4 + int.from_bytes(block[1:4], 'big')
+        f.seek(offset)
+        # 最高位表示最后一个元数据块
+        if block[0] & 0x80:
+            break
+
+    # 帧同步码 0xFFF8（固定块大小）或 0xFFF9（可变块大小）
+    if f.read(2) not in (b'\xff\xf8', b'\xff\xf9'):
+        raise ValueError('no frame sync after metadata blocks')
+    return offset
+
+
+def _trailing_tags_start(f, size: int) -> int:
+    """文件末尾 ID3v1、APEv2 标签的起始位置，没有时为文件大小"""
+    end = size
+    if end >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b'TAG':
+            end -= 128
+    if end >= 32:
+        f.seek(end - 32)
+        footer = f.read(32)
+        if footer[:8] == b'APETAGEX':
+            # 标签大小包括尾部但不包括头部，flags 最高位表示存在头部
+            tag_size = int.from_bytes(footer[12:16], 'little')
+            flags = int.from_bytes(footer[20:24], 'little')
+            end -= tag_size + (32 if flags & 0x80000000 else 0)
+    return end
+
+
+def probe(path: str) -> Tuple[Optional[Payload], Optional[str]]:
+    """
+    在子进程中定位文件的音频数据
+
+    Returns:
+        (Payload, 错误信息)
+    """
+    try:
+        ext = path.rsplit('.', 1)[1].lower()
+        size = os.path.getsize(path)
+        if ext not in ('flac', 'mp3'):
+            return None, 'unsupported file type'
+        audio = mutagen.File(path, easy=True)
+        tags = audio.tags or {}
+        fields = sum(1 for field in TAG_FIELDS if any(str(v).strip() for v in tags.get(field, [])))
+        if ext == 'flac':
+            with open(path, 'rb') as f:
+                start = _flac_audio_offset(f)
+                end = _trailing_tags_start(f, size)
+        else:
+            start = audio.info.frame_offset
+            with open(path, 'rb') as f:
+                end = _trailing_tags_start(f, size)
+        if end <= start:
+            return None, 'no audio data'
+        return (path, ext, start, end, fields, size), None
+    except Exception as e:
+        return None, str(e)
+
+
+def payload_hash(payload: Payload) -> Optional[bytes]:
+    path, _, start, end, _, _ = payload
+    digest = hashlib.blake2b()
+    try:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(HASH_CHUNK, remaining))
+                if not chunk:
+                    return None
+                digest.update(chunk)
+                remaining -= len(chunk)
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def find_audio_duplicates(paths: Iterable[str], workers: Optional[int] = None,
+                          hash_workers: int = HASH_WORKERS) -> Tuple[List[List[str]], Dict[str, str]]:
+    """
+    查找音频数据相同的文件
+
+    每组中第一个是建议保留的文件：基本标签（歌手、专辑、标题等）最完整的副本，其次按路径排序。
+    不比较非音频数据的大小，否则 padding 和广告标签多的副本反而会被保留。
+
+    Args:
+        paths: 文件路径
+        workers: 定位音频数据的进程数，默认为 CPU 核数
+        hash_workers: 计算哈希的线程数
+
+    Returns:
+        ([[保留的文件, 重复文件, ...], ...], {无法处理的文件: 错误信息})
+    """
+    paths = list(paths)
+    errors: Dict[str, str] = {}
+    candidates: Dict[Tuple[str, int], List[Payload]] = {}
+    with process_pool(workers) as executor:
+        for path, (payload, error) in zip(paths, executor.map(probe, paths, chunksize=16)):
+            if error:
+                errors[path] = error
+                continue
+            _, ext, start, end, _, _ = payload
+            candidates.setdefault((ext, end - start), []).append(payload)
+
+    groups = [group for group in candidates.values() if len(group) > 1]
+    members = [payload for group in groups for payload in group]
+    with ThreadPoolExecutor(max_workers=hash_workers) as executor:
+        digests = iter(executor.map(payload_hash, members))
+
+        duplicates = []
+        for group in groups:
+            buckets: Dict[bytes, List[Payload]] = {}
+            for payload, digest in zip(group, digests):
+                if digest is not None:
+                    buckets.setdefault(digest, []).append(payload)
+            for bucket in buckets.values():
+                if len(bucket) > 1:
+                    bucket.sort(key=lambda p: (-p[4], p[0]))
+                    duplicates.append([payload[0] for payload in bucket])
+    return duplicates, errors
@@ -3,30 +3,42 @@
 import re
 import os
 import sys
-from tag import FileMetadata
-from artist import ALL
-from detect import suspect
+from tag import read_metadata
+from detect import suspect_batch
+from matcher import default_matcher
+from library import destination
 
-ALL_ARTISTS = set(ALL)
+ARTIST_MATCHER = default_matcher()
 
 INPUT_PATH = sys.argv[1] if len(sys.argv) > 1 else '.'
 OUTPUT_PATH = sys.argv[2] if len(sys.argv) > 2 else INPUT_PATH
 
+# 每次请求包含的文件数，以及同时进行的请求数
+LLM_BATCH_SIZE = 8
+LLM_CONCURRENCY = 2
 
-for path in os.listdir(INPUT_PATH):
-    path = os.path.join(INPUT_PATH, path)
 
-    if not os.path.isfile(path):
-        continue
+def move(path: str, artist: str, album: str, title: str):
+    new_path = destination(OUTPUT_PATH, path, artist, album, title)
+
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    print(f'{path} -> {new_path}')
+    os.rename(path, new_path)
 
-    try:
-        metadata = FileMetadata(path)
-    except Exception as e:
+
+# 本地无法识别的文件，最后统一交给 AI 批量处理: [(路径, 文件名, 元信息, 专辑)]
+pending = []
+
+paths = [os.path.join(INPUT_PATH, path) for path in os.listdir(INPUT_PATH)]
+paths = [path for path in paths if os.path.isfile(path)]
+
+# 标签在进程池中并行解析，未变化的文件直接使用缓存
+for path, metadata, error in read_metadata(paths):
+    if error:
         print(f'file: {path}')
-        print(f'error: {e}')
+        print(f'error: {error}')
         continue
         
-    metadata = metadata.get_metadata()
     artist = metadata['artist'].strip()
     album = metadata['album'].strip()
     title = metadata['title'].strip()
@@ -35,50 +47,53 @@ for path in os.listdir(INPUT_PATH):
     if not artist or not title:
         file = path.rsplit('/', 1)[-1]
         parts = re.split(r's*-s*|s+', file)
+        # 先用歌手库在本地匹配，支持多个歌手连写、全角字符等情况
+        resolved = ARTIST_MATCHER.resolve_filename(file.rsplit('.', 1)[0])
+        if resolved:
+            artist, title = resolved
         # 如果文件名无法分割，直接删了吧
-        if len(parts) < 2:
+        elif len(parts) < 2:
             print(f'file: {file}')
             print(f'error: cannot parse artist and title')
             os.remove(path)
+            continue
         # 分割完成，如果分割超出预期，需要手动处理
         elif len(parts) > 2:
             continue
         else:
             maybe_artist = parts[0].strip()
             maybe_title = parts[1].rsplit('.', 1)[0].strip()
-            if maybe_artist in ALL_ARTISTS:
+            if maybe_artist in ARTIST_MATCHER:
                 artist = maybe_artist
                 title = maybe_title
-            elif maybe_title in ALL_ARTISTS:
+            elif maybe_title in ARTIST_MATCHER:
                 artist = maybe_title
                 title = maybe_artist
-            else: # 无法判断歌手，用 AI 处理
-                print(f'file: {file}')
-                print(f'metadata: {metadata}')
+            else: # 无法判断歌手，稍后用 AI 处理
+                pending.append((path, file, metadata, album))
+                continue
 
-                suspect_result = suspect(metadata, file)
-                print(f'  => suspect: {suspect_result}')
-                artist = suspect_result['artist']
-                title = suspect_result['title']
-                if not artist or not title:
-                    print(f'error: cannot parse artist and title')
-                    os.remove(path)
-                    continue
+    move(path, artist, album, title)
 
-    if '金曲' in album or '精选' in album or '合辑' in album or '粤语' in album or '国语' in album:
-        album = None
-    if not album or not album.strip():
-        album = '单曲'
 
-    ext = path.rsplit('.', 1)[1].lower()
-    new_name = f'{artist} - {title}.{ext}'
+if pending:
+    print(f'{len(pending)} files need AI to parse')
+    results = suspect_batch([(metadata, file) for _, file, metadata, _ in pending],
+                            batch_size=LLM_BATCH_SIZE, concurrency=LLM_CONCURRENCY)
 
-    if ',' in artist:
-        artist = artist.split(',')[0].strip()
-
-    new_path = os.path.join(OUTPUT_PATH, artist, album, new_name)
+    for (path, file, metadata, album), suspect_result in zip(pending, results):
+        print(f'file: {file}')
+        print(f'metadata: {metadata}')
+        print(f'  => suspect: {suspect_result}')
+        # 请求失败，保留文件，下次再处理
+        if suspect_result is None:
+            print(f'error: AI request failed, skipped')
+            continue
+        artist = suspect_result['artist']
+        title = suspect_result['title']
+        if not artist or not title:
+            print(f'error: cannot parse artist and title')
+            os.remove(path)
+            continue
 
-    os.makedirs(os.path.dirname(new_path), exist_ok=True)
-    print(f'{path} -> {new_path}')
-    os.rename(path, new_path)
-        
\ No newline at end of file
+        move(path, artist, album, title)
@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+# 脚本需要兼容 Python3.9 (FreeBSD)
+"""
+将 APE 和 WAV 转换为 FLAC
+
+APE 解码慢、播放器上不便拖动，WAV 没有标签，分类时只能依赖文件名。
+在进程池中用 ffmpeg 转换，标签（和内嵌封面）随之复制。转换后分别解码原文件和 FLAC 文件，
+比较解码后样本的 MD5，完全一致才用 FLAC 文件代替原文件：
+先写入同目录下的临时文件，校验通过后硬链接为 .flac，再删除原文件，任何时候都不会只剩下不完整的文件。
+目标 .flac 已存在（包括转换期间出现的）时不会覆盖；同一目录下同名的 APE 和 WAV（如 song.ape 和 song.wav）
+会转换为同一个 song.flac，这样的文件都跳过，需要手动处理。
+
+用法：python3 convert-flac.py <音乐目录> [--dry-run] [--keep] [--jobs N]
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from tag import process_pool
+from library import walk_tree
+
+
+EXTENSIONS = ('.ape', '.wav')
+COMPRESSION_LEVEL = '8'
+
+
+def walk_files(path: str, index: Optional[str] = None) -> Iterable[str]:
+    for (root, _, fs) in walk_tree(path, index):
+        for f in fs:
+            yield os.path.join(root, f)
+
+
+def flac_path(path: str) -> str:
+    return path.rsplit('.', 1)[0] + '.flac'
+
+
+def split_collisions(files: List[str]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Returns:
+        (可以转换的文件, {目标 FLAC 路径: [会转换为同一个文件的原文件, ...]})
+    """
+    targets: Dict[str, List[str]] = defaultdict(list)
+    for path in files:
+        targets[flac_path(path)].append(path)
+    unique = [sources[0] for sources in targets.values() if len(sources) == 1]
+    collisions = {target: sources for target, sources in targets.items() if len(sources) > 1}
+    return unique, collisions
+
+
+def sample_md5(path: str) -> str:
+    """解码后样本的 MD5，统一转换为 32 位整数，不同格式的解码结果可以直接比较"""
+    cmd = ['ffmpeg', '-v', 'error', '-i', path, '-map', '0:a:0', '-c:a', 'pcm_s32le', '-f', 'md5', '-']
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    # 输出形如 MD5=0123...
+    return result.stdout.strip().split('=', 1)[1]
+
+
+def encode(source: str, target: str) -> None:
+    cmd = ['ffmpeg', '-v', 'error', '-y', '-i', source,
+           '-map', '0:a:0', '-map', '0:v?', '-map_metadata', '0',
+           '-c:a', 'flac', '-compression_level', COMPRESSION_LEVEL, '-c:v', 'copy',
+           '-f', 'flac', target]
+    subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+
+def convert(path: str, dry_run: bool, keep: bool) -> Tuple[str, Optional[str], int, Optional[str]]:
+    """
+    在子进程中转换一个文件
+
+    Returns:
+        (原路径, FLAC 路径, 减少的字节数, 错误信息)
+    """
+    target = flac_path(path)
+    if os.path.exists(target):
+        return path, None, 0, f'{target} already exists'
+    if dry_run:
+        return path, target, 0, None
+
+    temp_path = os.path.join(os.path.dirname(target), f'.{os.path.basename(target)}.tmp')
+    try:
+        encode(path, temp_path)
+        if sample_md5(path) != sample_md5(temp_path):
+            raise Exception('decoded samples differ')
+
+        st = os.stat(path)
+        os.utime(temp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        saved = st.st_size - os.path.getsize(temp_path)
+        # link 在目标已存在时失败，不会覆盖检查之后才出现的 .flac；临时文件在 finally 中删除
+        try:
+            os.link(temp_path, target)
+        except FileExistsError:
+            return path, None, 0, f'{target} already exists'
+        if not keep:
+            os.remove(path)
+        return path, target, saved, None
+    except subprocess.CalledProcessError as e:
+        return path, None, 0, e.stderr.strip() or str(e)
+    except Exception as e:
+        return path, None, 0, str(e)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def check_dependencies() -> None:
+    try:
+        subprocess.run(['ffmpeg', '-version'], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        print('error: ffmpeg not found')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert APE and WAV files to verified FLAC')
+    parser.add_argument('path', nargs='?', default='.', help='Path to the music library')
+    parser.add_argument('--dry-run', action='store_true', help='Only show what would be converted')
+    parser.add_argument('--keep', action='store_true', help='Keep the original files')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--index', default=None, help='Walk from an fsindex.py snapshot database')
+    args = parser.parse_args()
+
+    check_dependencies()
+    found = [f for f in walk_files(args.path, args.index) if f.lower().endswith(EXTENSIONS)]
+    files, collisions = split_collisions(found)
+    converted = freed = 0
+    failed = sum(len(sources) for sources in collisions.values())
+    for target, sources in collisions.items():
+        print(f'skip: {", ".join(sources)} would all be converted to {target}')
+
+    with process_pool(args.jobs) as executor:
+        count = len(files)
+        for path, target, saved, error in executor.map(
+                convert, files, [args.dry_run] * count, [args.keep] * count):
+            if error:
+                print(f'file: {path}')
+                print(f'error: {error}')
+                failed += 1
+                continue
+            print(f'{path} -> {target}')
+            converted += 1
+            freed += saved
+
+    action = 'would convert' if args.dry_run else 'converted'
+    print(f'{len(found)} files found, {action} {converted}, {failed} failed or skipped')
+    if not args.dry_run and not args.keep:
+        print(f'{freed / 1024 ** 2:.1f} MiB freed')
@@ -0,0 +1,52 @@
+#! /usr/bin/env python3
+# 脚本需要兼容 Python3.9 (FreeBSD)
+
+import os
+import argparse
+from typing import Iterable, Optional
+from audiohash import find_audio_duplicates
+from library import walk_tree
+
+
+EXTENSIONS = ('.flac', '.mp3')
+
+
+def walk_files(path: str, index: Optional[str] = None) -> Iterable[str]:
+    for (root, _, fs) in walk_tree(path, index):
+        for f in fs:
+            yield os.path.join(root, f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove copies of the same recording that differ only in tags')
+    parser.add_argument('path', nargs='?', default='.', help='Path to the music library')
+    parser.add_argument('--dry-run', action='store_true', help='Only show what would be deleted')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--index', default=None, help='Walk from an fsindex.py snapshot database')
+    args = parser.parse_args()
+
+    files = [f for f in walk_files(args.path, args.index) if f.lower().endswith(EXTENSIONS)]
+    groups, errors = find_audio_duplicates(files, args.jobs)
+    for path, error in errors.items():
+        print(f'file: {path}')
+        print(f'error: {error}')
+
+    removed = freed = 0
+    for group in groups:
+        print(f'keep: {group[0]}')
+        for path in group[1:]:
+            print(f'  duplicate: {path}')
+            if args.dry_run:
+                continue
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+                freed += size
+            except OSError as e:
+                print(f'  error: {e}')
+
+    duplicates = sum(len(group) - 1 for group in groups)
+    print(f'{len(files)} files scanned, {duplicates} duplicates in {len(groups)} groups, {len(errors)} failed')
+    if not args.dry_run:
+        print(f'{removed} files deleted, {freed / 1024 ** 2:.1f} MiB freed')
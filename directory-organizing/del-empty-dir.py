@@ -3,9 +3,17 @@
 import os
 import sys
 
+# treetools 位于仓库根目录
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from treetools import DEFAULT_WORKERS, make_walker, plan_tree, execute_plan
+
 PATH = sys.argv[1] if len(sys.argv) > 1 else '.'
+JOBS = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WORKERS
+INDEX = sys.argv[3] if len(sys.argv) > 3 else None
 
-for root, dirs, files in os.walk(PATH, topdown=False):
-    if not files and not dirs:
+plan = plan_tree(PATH, flatten=False, prune=True, walker=make_walker(JOBS, INDEX))
+for _, root, _, error in execute_plan(plan):
+    if error:
+        print(f'cannot delete {root}: {error}')
+    else:
         print(f'deleting empty directory: {root}')
-        os.rmdir(root)
\ No newline at end of file
@@ -2,7 +2,13 @@
 # This file requires ollama to be installed. You can install it with:
 # pip install ollama
 
-import ollama
+import os
+import json
+import asyncio
+import sqlite3
+import hashlib
+import unicodedata
+from typing import List, Optional, Tuple
 from pprint import pprint
 
 _SYSTEM_PROMPT = """
@@ -22,23 +28,109 @@ type: live
 不要任何额外的说明！
 """
 
-_client = ollama.Client(host='http://192.168.130.200:11434')
+_BATCH_SYSTEM_PROMPT = """
+你是一个程序组件。
+我会给你提供多个音频文件，每个文件有编号（id）、元信息和原始的文件名，它们可能包含错误，也可能缺失。
+一首歌可能由多个歌手创作，并且标题可能也包含了歌手，你需要将他们识别出来。
+如，“刘若英_黄韵玲-听！是谁在唱歌” 中，歌手为“刘若英, 黄韵玲”；“高明骏陈艾湄-那种心跳的感觉“ 中，歌手为“高明骏, 陈艾湄”；“小星星Aurora-红黑” 中，歌手为“小星星Aurora”。
+字段里可能包含一些广告或来源信息，忽略它们。
+你需要为每个文件提供实际的歌手名称、专辑名称和音乐标题，每个结果应包含id、artist、album、title、type五部分内容。若某字段不存在则内容留空。
+如果歌手有多个，请用逗号分隔。
+如果你认为这是一首现场版音乐（live版本），将type置为“live”，若为 DJ 则标记“DJ”，否则留空。
+请按照以下 JSON 格式回答，每个文件一项：
+{"results": [{"id": 0, "artist": "周杰伦", "album": "", "title": "双节棍", "type": "live"}]}
+不要任何额外的说明！
+"""
 
+_OLLAMA_HOST = 'http://192.168.130.200:11434'
+_MODEL = 'azure99/blossom-v5'
+_PROMPT_TEMPLATE = 'metadata: {metadata}\nfilename: {filename}'
+# 提示词变化后，旧的缓存自动失效
+_PROMPT_HASH = hashlib.sha256((_SYSTEM_PROMPT + _PROMPT_TEMPLATE).encode()).hexdigest()
+_BATCH_PROMPT_HASH = hashlib.sha256(_BATCH_SYSTEM_PROMPT.encode()).hexdigest()
+_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.llm-cache.sqlite')
+_CACHE_FIELDS = ('artist', 'album', 'title', 'type')
 
+_client = None
+_cache: Optional[sqlite3.Connection] = None
 
-def suspect(metadata: dict, filename: str) -> dict:
+
+def _get_client():
+    """首次需要 LLM 时才导入 ollama 并创建客户端，本地就能识别的批次不需要付出这部分开销."""
+    global _client
+    if _client is None:
+        import ollama
+        _client = ollama.Client(host=_OLLAMA_HOST)
+    return _client
+
+
+def _get_cache() -> sqlite3.Connection:
+    global _cache
+    if _cache is None:
+        _cache = sqlite3.connect(_CACHE_PATH)
+        _cache.execute(
+            'CREATE TABLE IF NOT EXISTS answers ('
+            'key TEXT PRIMARY KEY, model TEXT, prompt_hash TEXT, '
+            'artist TEXT, album TEXT, title TEXT, type TEXT, created_at INTEGER)')
+    return _cache
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKC', str(text))
+    return ' '.join(text.split())
+
+
+def _cache_key(text_metadata: str, text_filename: str, prompt_hash: str = _PROMPT_HASH) -> str:
+    """以归一化后的元信息、文件名、模型和提示词为内容计算缓存键."""
+    content = json.dumps([_normalize(text_metadata), _normalize(text_filename), _MODEL, prompt_hash],
+                         ensure_ascii=False)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _load_answer(key: str) -> Optional[dict]:
+    row = _get_cache().execute(
+        'SELECT artist, album, title, type FROM answers WHERE key = ?', (key,)).fetchone()
+    return dict(zip(_CACHE_FIELDS, row)) if row else None
+
+
+def _save_answer(key: str, answer: dict, prompt_hash: str = _PROMPT_HASH) -> None:
+    cache = _get_cache()
+    cache.execute(
+        'INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, strftime(\'%s\', \'now\'))',
+        (key, _MODEL, prompt_hash) + tuple(answer.get(field) for field in _CACHE_FIELDS))
+    cache.commit()
+
+
+def _prepare(metadata: dict, filename: str) -> Tuple[str, str]:
     text_metadata = '\n'.join([f'{k}: {v}' for k, v in metadata.items()])
     
     for ext in ['mp3', 'flac', 'ape', 'wav', 'm4a']:
         if filename.endswith(ext):
             filename = filename.rstrip(ext)
             break
-    text_filename = filename
+    return text_metadata, filename
+
+
+def suspect(metadata: dict, filename: str) -> dict:
+    text_metadata, text_filename = _prepare(metadata, filename)
+
+    # 同样的文件已经问过模型，直接使用缓存的结果.
+    key = _cache_key(text_metadata, text_filename)
+    cached = _load_answer(key)
+    if cached is not None:
+        return cached
+
+    # _ask 的结果可能包含列表等非文本字段，归一化后才能写入缓存
+    answer = _normalize_answer(_ask(text_metadata, text_filename))
+    _save_answer(key, answer)
+    return answer
+
 
-    response = _client.generate(
-        model='azure99/blossom-v5',
+def _ask(text_metadata: str, text_filename: str) -> dict:
+    response = _get_client().generate(
+        model=_MODEL,
         system=_SYSTEM_PROMPT,
-        prompt=f'metadata: {text_metadata}\nfilename: {text_filename}',
+        prompt=_PROMPT_TEMPLATE.format(metadata=text_metadata, filename=text_filename),
         keep_alive=600,
     )['response'].strip()
 
@@ -56,10 +148,158 @@ def suspect(metadata: dict, filename: str) -> dict:
     parsed_dict = {}
     for line in lines:
         parts = line.split(':', 1)
-        key = parts[0]
+        # 没有冒号的行是多余的说明，忽略
+        if len(parts) < 2:
+            continue
+        key = parts[0].strip()
         value = parts[1].strip() if len(parts[1]) > 1 else None
         parsed_dict[key] = value
     if 'album' not in parsed_dict or not parsed_dict['album']:
         parsed_dict['album'] = None
 
     return parsed_dict
+
+
+
+class _JsonObjectScanner:
+    """增量扫描流式输出，顶层 JSON 对象闭合时即可停止读取."""
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> bool:
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+                self.started = True
+            elif char in '}]':
+                self.depth -= 1
+                if self.started and self.depth == 0:
+                    return True
+        return False
+
+
+def _field_text(value) -> str:
+    """模型偶尔把字段写成列表（如多个歌手）或数字，统一转换为文本."""
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ', '.join(_field_text(item) for item in value if item is not None)
+    return str(value).strip()
+
+
+def _normalize_answer(answer: dict) -> dict:
+    parsed_dict = {field: _field_text(answer.get(field)) for field in _CACHE_FIELDS}
+    if not parsed_dict['album']:
+        parsed_dict['album'] = None
+    return parsed_dict
+
+
+async def _ask_batch(client, semaphore: asyncio.Semaphore, batch: List[Tuple[str, str]]) -> dict:
+    """
+    一次请求识别多个文件，使用 JSON 结构化输出.
+
+    Returns:
+        {批次内编号: 结果}，模型遗漏或格式错误的文件不在其中；请求失败时为空
+    """
+    try:
+        return await _request_batch(client, semaphore, batch)
+    except Exception as e:
+        # 一个批次失败不影响其他批次，其中的文件退回到逐个请求的 suspect()
+        print(f'error: batch request failed: {e}')
+        return {}
+
+
+async def _request_batch(client, semaphore: asyncio.Semaphore, batch: List[Tuple[str, str]]) -> dict:
+    prompt = json.dumps([{'id': i, 'metadata': text_metadata, 'filename': text_filename}
+                         for i, (text_metadata, text_filename) in enumerate(batch)], ensure_ascii=False)
+    async with semaphore:
+        response = ''
+        scanner = _JsonObjectScanner()
+        stream = await client.generate(
+            model=_MODEL,
+            system=_BATCH_SYSTEM_PROMPT,
+            prompt=prompt,
+            format='json',
+            stream=True,
+            keep_alive=600,
+        )
+        async for chunk in stream:
+            response += chunk['response']
+            # 结果已经完整，不再等待模型输出剩余的空白等内容
+            if scanner.feed(chunk['response']):
+                break
+
+    try:
+        results = json.loads(response)['results']
+    except (ValueError, KeyError, TypeError):
+        print(f'error: cannot parse batch response: {response}')
+        return {}
+
+    answers = {}
+    for result in results:
+        if isinstance(result, dict) and isinstance(result.get('id'), int) and 0 <= result['id'] < len(batch):
+            answers[result['id']] = _normalize_answer(result)
+    return answers
+
+
+async def _ask_all(batches: List[List[int]], prepared: List[Tuple[str, str]], keys: List[str],
+                   answers: List[Optional[dict]], concurrency: int) -> None:
+    """并发请求所有批次，每个批次完成后立即写入 answers 和缓存，中途出错时已完成的结果不会丢失."""
+    import ollama
+    client = ollama.AsyncClient(host=_OLLAMA_HOST)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ask_and_save(batch: List[int]) -> None:
+        result = await _ask_batch(client, semaphore, [prepared[i] for i in batch])
+        for position, index in enumerate(batch):
+            if position in result:
+                answers[index] = result[position]
+                _save_answer(keys[index], result[position], _BATCH_PROMPT_HASH)
+
+    await asyncio.gather(*[ask_and_save(batch) for batch in batches])
+
+
+def suspect_batch(items: List[Tuple[dict, str]], batch_size: int = 8,
+                  concurrency: int = 2) -> List[Optional[dict]]:
+    """
+    批量识别多个文件，结果顺序与 items 相同.
+
+    已缓存的文件（包括 suspect() 逐个请求得到的结果）直接返回；其余文件每 batch_size 个合并为一次请求，最多 concurrency 个请求同时进行.
+    批量请求中遗漏的文件退回到逐个请求的 suspect()；仍然失败（如模型无法连接）的文件结果为 None，
+    调用者应保留这些文件，不能当作无法识别处理.
+
+    Args:
+        items: [(元信息, 文件名), ...]
+    """
+    prepared = [_prepare(metadata, filename) for metadata, filename in items]
+    keys = [_cache_key(text_metadata, text_filename, _BATCH_PROMPT_HASH)
+            for text_metadata, text_filename in prepared]
+
+    # 批量请求和逐个请求的结果分别以各自的提示词缓存，两者都可以复用
+    answers: List[Optional[dict]] = [_load_answer(key) or _load_answer(_cache_key(*text))
+                                     for key, text in zip(keys, prepared)]
+    missing = [i for i, answer in enumerate(answers) if answer is None]
+    if missing:
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        asyncio.run(_ask_all(batches, prepared, keys, answers, concurrency))
+
+    for i, answer in enumerate(answers):
+        if answer is None:
+            try:
+                answers[i] = suspect(*items[i])
+            except Exception as e:
+                print(f'error: {items[i][1]}: {e}')
+    return answers
@@ -0,0 +1,177 @@
+#! /usr/bin/env python3
+# 脚本需要兼容 Python3.9 (FreeBSD)
+"""
+将内嵌封面提取为专辑目录中的 cover.jpg
+
+同一张专辑的每个文件通常都内嵌了同一张封面（每份 1~5 MB）。按哈希统计每个目录中的封面，
+出现最多的一张写入 cover.jpg（PNG 封面写入 cover.png），已存在的封面文件不会被覆盖。
+
+使用 --strip 时，删除与目录封面文件完全相同的内嵌图片，去掉多余的 padding 使文件变小；
+内嵌了其他图片的文件保持不变，不会丢失图片。
+
+用法：python3 extract-covers.py <音乐目录> [--strip] [--dry-run] [--jobs N]
+"""
+
+import os
+import hashlib
+import argparse
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from tag import FileMetadata, PICTURE_FRONT_COVER, process_pool
+from library import AUDIO_EXTENSIONS, walk_tree
+
+
+COVER_NAMES = {'image/jpeg': 'cover.jpg', 'image/jpg': 'cover.jpg', 'image/png': 'cover.png'}
+
+# (哈希, MIME 类型, 图片类型, 大小)
+Picture = Tuple[bytes, str, int, int]
+
+
+def digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data).digest()
+
+
+def walk_albums(path: str, index: Optional[str] = None) -> Iterable[Tuple[str, List[str]]]:
+    for (root, _, fs) in walk_tree(path, index):
+        files = [os.path.join(root, f) for f in fs if f.lower().endswith(AUDIO_EXTENSIONS)]
+        if files:
+            yield root, files
+
+
+def inspect(path: str) -> Tuple[str, List[Picture], Optional[str]]:
+    """在子进程中读取内嵌图片的哈希，图片数据不传回主进程"""
+    try:
+        pictures = FileMetadata(path).pictures()
+        return path, [(digest(data), mime, picture_type, len(data)) for mime, picture_type, data in pictures], None
+    except Exception as e:
+        return path, [], str(e)
+
+
+def strip(path: str, dry_run: bool) -> Tuple[str, int, bool, Optional[str]]:
+    """
+    在子进程中删除内嵌图片并去掉多余的 padding
+
+    Returns:
+        (路径, 减少的字节数, 是否重写了整个文件, 错误信息)
+    """
+    try:
+        size = os.path.getsize(path)
+        metadata = FileMetadata(path)
+        with metadata.edit(compact=True, save=not dry_run):
+            metadata.remove_pictures()
+        return path, size - os.path.getsize(path), metadata.rewritten, None
+    except Exception as e:
+        return path, 0, False, str(e)
+
+
+def choose_cover(pictures: Dict[str, List[Picture]]) -> Optional[Picture]:
+    """目录中出现次数最多的封面；文件没有标记为封面的图片时使用第一张图片"""
+    counts: Counter = Counter()
+    found: Dict[bytes, Picture] = {}
+    for file_pictures in pictures.values():
+        if not file_pictures:
+            continue
+        fronts = [p for p in file_pictures if p[2] == PICTURE_FRONT_COVER] or file_pictures[:1]
+        counts[fronts[0][0]] += 1
+        found.setdefault(fronts[0][0], fronts[0])
+    if not counts:
+        return None
+    return found[counts.most_common(1)[0][0]]
+
+
+def write_cover(source: str, picture_digest: bytes, target: str) -> None:
+    """从 source 中取出哈希为 picture_digest 的图片，通过临时文件原子写入 target"""
+    for _, _, data in FileMetadata(source).pictures():
+        if digest(data) == picture_digest:
+            temp_path = target + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, target)
+            return
+    raise Exception('picture not found')
+
+
+def file_digest(path: str) -> Optional[bytes]:
+    try:
+        with open(path, 'rb') as f:
+            return digest(f.read())
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract embedded album covers into one cover file per album')
+    parser.add_argument('path', nargs='?', default='.', help='Path to the music library')
+    parser.add_argument('--strip', action='store_true', help='Remove embedded copies of the extracted cover')
+    parser.add_argument('--dry-run', action='store_true', help='Only show what would change')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--index', default=None, help='Walk from an fsindex.py snapshot database')
+    args = parser.parse_args()
+
+    albums = list(walk_albums(args.path, args.index))
+    files = [f for _, album_files in albums for f in album_files]
+    written = 0
+    to_strip = []
+
+    with process_pool(args.jobs) as executor:
+        pictures: Dict[str, List[Picture]] = {}
+        for path, file_pictures, error in executor.map(inspect, files, chunksize=16):
+            if error:
+                print(f'file: {path}')
+                print(f'error: {error}')
+                continue
+            pictures[path] = file_pictures
+
+        for directory, album_files in albums:
+            album_pictures = {f: pictures[f] for f in album_files if f in pictures}
+            cover = choose_cover(album_pictures)
+            if cover is None:
+                continue
+            cover_digest, mime, _, size = cover
+            name = COVER_NAMES.get(mime.lower())
+            if name is None:
+                print(f'skip: {directory}: unsupported cover type {mime}')
+                continue
+
+            target = os.path.join(directory, name)
+            if os.path.exists(target):
+                # 已有封面文件：不覆盖，只删除与它相同的内嵌图片
+                cover_digest = file_digest(target)
+            else:
+                source = next(f for f, ps in album_pictures.items() if any(p[0] == cover_digest for p in ps))
+                print(f'{target} <- {source} ({size / 1024:.0f} KiB)')
+                if not args.dry_run:
+                    try:
+                        write_cover(source, cover_digest, target)
+                    except Exception as e:
+                        print(f'error: {target}: {e}')
+                        continue
+                written += 1
+
+            # 只有所有内嵌图片都与封面文件相同的文件才删除内嵌图片
+            to_strip.extend(f for f, ps in album_pictures.items() if ps and all(p[0] == cover_digest for p in ps))
+
+        stripped = freed = 0
+        rewritten = []
+        if args.strip:
+            for path, saved, full_rewrite, error in executor.map(
+                    strip, to_strip, [args.dry_run] * len(to_strip), chunksize=16):
+                if error:
+                    print(f'file: {path}')
+                    print(f'error: {error}')
+                    continue
+                stripped += 1
+                freed += saved
+                if full_rewrite:
+                    rewritten.append(path)
+
+    action = 'would write' if args.dry_run else 'wrote'
+    print(f'{len(files)} files in {len(albums)} directories scanned, {action} {written} covers')
+    if args.strip:
+        if args.dry_run:
+            print(f'would strip embedded covers from {stripped} files')
+        else:
+            print(f'stripped embedded covers from {stripped} files, {freed / 1024 ** 2:.1f} MiB freed, '
+                  f'{len(rewritten)} files rewritten in full')
+    else:
+        print(f'{len(to_strip)} files only embed the album cover, use --strip to remove those copies')
@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+# 脚本需要兼容 Python3.9 (FreeBSD)
+"""
+音乐库的整理规则
+
+remove-ad.py、classify-artist.py、simplified-chinese.py 和 organize-music.py 共用：
+标签中的广告屏蔽词、繁体转简体，以及 歌手/专辑/歌手 - 歌名.扩展名 的目标路径。
+"""
+
+import os
+import sys
+from functools import lru_cache
+from typing import FrozenSet, Iterable, List, Optional, Tuple
+
+
+BLOCK_WORDS = ['车载', '酷我', '酷狗', 'wx', '排行榜', '无损', '正版', 'www.', '.com', 'qq', '出品', '精品', '3D环绕', '优音', '抖音', '歌曲', '流行', '音樂論壇', '音乐论坛', '收藏']
+# tag.FileMetadata 支持的格式
+AUDIO_EXTENSIONS = ('.flac', '.mp3', '.ape')
+
+# 专辑名包含这些词时视为合辑，归入单曲
+COMPILATION_WORDS = ('金曲', '精选', '合辑', '粤语', '国语')
+SINGLES_ALBUM = '单曲'
+
+LOCALE = 'zh-cn'
+
+
+
+@lru_cache(maxsize=None)
+def convertible_chars() -> FrozenSet[str]:
+    """
+    转换表中所有词条的首字：zhconv 只会在这些字符的位置开始替换，
+    名称中不含其中任何一个字符时，转换结果一定与原名称相同
+
+    导入 zhconv 并建表约需 140ms，只有第一次转换时才付出这部分开销，
+    不做转换的脚本（remove-ad.py、classify-artist.py）不受影响。
+    """
+    from zhconv.zhconv import getdict
+    return frozenset(word[0] for word in getdict(LOCALE))
+
+
+@lru_cache(maxsize=65536)
+def to_simplified(name: str) -> str:
+    """转换单个名称（文件名、目录名或标签值），大部分名称不需要调用 zhconv"""
+    if convertible_chars().isdisjoint(name):
+        return name
+    from zhconv import convert
+    return convert(name, LOCALE)
+
+
+def walk_tree(path: str, index: Optional[str] = None) -> Iterable[Tuple[str, List[str], List[str]]]:
+    """
+    自底向上遍历目录树，与 os.walk(path, topdown=False) 相同
+
+    Args:
+        index: 快照索引文件（见 fsindex.py），指定时先增量刷新索引，再从索引遍历，
+               只有修改过的目录需要重新读取；返回的路径为绝对路径
+    """
+    if index is None:
+        return os.walk(path, topdown=False)
+    # fsindex 位于仓库根目录
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from fsindex import FsIndex
+    return FsIndex(index).refreshed_walk(path)
+
+
+def _path_component(name: str) -> str:
+    """标签值中的 / 会产生多余的目录层级"""
+    return name.replace('/', '_').strip()
+
+
+def destination(root: str, path: str, artist: str, album: str, title: str) -> str:
+    """
+    文件在音乐库中的位置：root/歌手/专辑/歌手 - 歌名.扩展名
+
+    多个歌手时目录使用第一个歌手，文件名保留全部歌手；没有专辑或专辑为合辑时归入单曲。
+
+    Args:
+        root: 音乐库根目录
+        path: 文件当前路径，用于取得扩展名
+    """
+    if album and any(word in album for word in COMPILATION_WORDS):
+        album = None
+    if not album or not album.strip():
+        album = SINGLES_ALBUM
+
+    ext = path.rsplit('.', 1)[1].lower()
+    new_name = f'{artist} - {title}.{ext}'
+
+    if ',' in artist:
+        artist = artist.split(',')[0].strip()
+
+    return os.path.join(root, _path_component(artist), _path_component(album), _path_component(new_name))
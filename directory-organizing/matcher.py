@@ -0,0 +1,379 @@
+#! /usr/bin/env python3
+# 脚本需要兼容 Python3.9 (FreeBSD)
+"""
+歌手名多模式匹配
+
+基于 artist.py 中的歌手列表构建 Aho-Corasick 自动机，一次扫描找出文本中出现的所有歌手名。
+匹配前统一做全角/半角（NFKC）和大小写归一化。连续书写的多个歌手（如“高明骏陈艾湄”）
+通过正向最大匹配切分。
+
+artist.py 是便于编辑的源数据，运行时使用预先构建的 artist.idx：归一化并排序的歌手名
+和自动机的状态表都以定长数组保存，直接 mmap 使用，不需要解析 Python 源码或重建自动机。
+artist.py 的内容发生变化后，首次使用时会自动重新构建。
+
+用法：python3 matcher.py --build            重新构建 artist.idx
+      python3 matcher.py [文件名 ...]       测试文件名识别
+"""
+
+import os
+import re
+import sys
+import mmap
+import struct
+import bisect
+import hashlib
+import unicodedata
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+ARTIST_SOURCE = os.path.join(_DIRECTORY, 'artist.py')
+ARTIST_INDEX = os.path.join(_DIRECTORY, 'artist.idx')
+
+# 歌手之间的分隔符，如“刘若英_黄韵玲”、“A & B”、“A feat. B”
+_SEPARATORS = re.compile(r'(?:[\s_&,，、/+×]|feat\.?|ft\.)*')
+# 文件名中歌手和标题之间的分隔符
+_TITLE_SEPARATOR = re.compile(r'\s*[-－—]\s*')
+
+# 索引文件：魔数、artist.py 的 SHA-1，之后是 _SECTIONS 中的各段，每段前为 8 字节长度。
+# 数组均为小端 uint32。
+_MAGIC = b'ARTIDX2\0'
+_SECTIONS = [
+    'name_offsets',   # 归一化名称在 name_blob 中的字节偏移，按名称排序，模式编号即排序位置
+    'name_blob',      # 归一化名称，UTF-8
+    'label_offsets',  # 原始名称在 label_blob 中的字节偏移
+    'label_blob',     # 原始名称，UTF-8
+    'lengths',        # 归一化名称的字符数
+    'child_start',    # 每个状态第一个子状态的编号（状态按广度优先编号，子状态连续）
+    'char',           # 进入每个状态的字符码位，同一状态的子状态之间有序
+    'fail',
+    'output_start',   # 每个状态结束的模式在 output 中的起始位置（已合并失败链）
+    'output',
+]
+
+
+def normalize(text: str) -> str:
+    """全角转半角、统一大小写"""
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+def _transition(child_start, chars, state: int, code: int) -> Optional[int]:
+    """状态 state 经字符 code 转移到的状态，没有转移时返回 None"""
+    start, end = child_start[state], child_start[state + 1]
+    child = bisect.bisect_left(chars, code, start, end)
+    if child < end and chars[child] == code:
+        return child
+    return None
+
+
+def _source_digest() -> Optional[bytes]:
+    try:
+        with open(ARTIST_SOURCE, 'rb') as f:
+            return hashlib.sha1(f.read()).digest()
+    except OSError:
+        return None
+
+
+class ArtistMatcher:
+    """Aho-Corasick 自动机，状态表为扁平的 uint32 数组（array 或 mmap 上的 memoryview）"""
+
+    def __init__(self, tables: Dict[str, object]):
+        self.tables = tables
+        for name in _SECTIONS:
+            setattr(self, name, tables[name])
+        self.size = len(self.lengths)
+
+    @classmethod
+    def from_names(cls, names: Iterable[str]) -> 'ArtistMatcher':
+        labels: Dict[str, str] = {}
+        for name in names:
+            name = name.strip()
+            pattern = normalize(name)
+            if pattern and pattern not in labels:
+                labels[pattern] = name
+        patterns = sorted(labels)
+
+        # 先用字典构建 trie
+        trie: List[Dict[int, int]] = [{}]
+        terminal: Dict[int, int] = {}
+        for pattern_id, pattern in enumerate(patterns):
+            # 单个字符的名称在文本中误判太多，只用于精确查找，不加入自动机
+            if len(pattern) < 2:
+                continue
+            state = 0
+            for char in pattern:
+                code = ord(char)
+                if code not in trie[state]:
+                    trie[state][code] = len(trie)
+                    trie.append({})
+                state = trie[state][code]
+            terminal[state] = pattern_id
+
+        # 按广度优先重新编号，同一状态的子状态编号连续且按字符排序，
+        # 转移只需要记录子状态的起始编号和每个状态的入边字符
+        child_start, chars = array('I'), array('I', [0])
+        renumbered = [0]
+        queue = deque([0])
+        while queue:
+            old_state = queue.popleft()
+            child_start.append(len(renumbered))
+            for code in sorted(trie[old_state]):
+                child = trie[old_state][code]
+                renumbered.append(child)
+                chars.append(code)
+                queue.append(child)
+        child_start.append(len(renumbered))
+        tables: Dict[str, object] = {'child_start': child_start, 'char': chars}
+
+        # 编号即广度优先顺序，父状态总是先于子状态处理
+        fail = [0] * len(renumbered)
+        output: List[List[int]] = [[terminal[old]] if old in terminal else [] for old in renumbered]
+        for state in range(1, len(renumbered)):
+            for child in range(child_start[state], child_start[state + 1]):
+                fallback = fail[state]
+                target = _transition(child_start, chars, fallback, chars[child])
+                while target is None and fallback:
+                    fallback = fail[fallback]
+                    target = _transition(child_start, chars, fallback, chars[child])
+                fail[child] = target or 0
+                output[child] = output[child] + output[fail[child]]
+
+        name_blob, name_offsets = bytearray(), array('I', [0])
+        label_blob, label_offsets = bytearray(), array('I', [0])
+        for pattern in patterns:
+            name_blob += pattern.encode()
+            name_offsets.append(len(name_blob))
+            label_blob += labels[pattern].encode()
+            label_offsets.append(len(label_blob))
+        tables.update(name_offsets=name_offsets, name_blob=bytes(name_blob),
+                      label_offsets=label_offsets, label_blob=bytes(label_blob),
+                      lengths=array('I', (len(p) for p in patterns)))
+
+        output_start, output_ids = array('I'), array('I')
+        for ids in output:
+            output_start.append(len(output_ids))
+            output_ids.extend(ids)
+        output_start.append(len(output_ids))
+        tables.update(fail=array('I', fail), output_start=output_start, output=output_ids)
+        return cls(tables)
+
+    def save(self, path: str, digest: bytes) -> None:
+        """写入索引文件（先写临时文件再替换，避免其他进程读到不完整的文件）"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(_MAGIC + digest)
+            for name in _SECTIONS:
+                data = self.tables[name]
+                if isinstance(data, array):
+                    if sys.byteorder != 'little':
+                        data = array('I', data)
+                        data.byteswap()
+                    data = data.tobytes()
+                data = bytes(data)
+                # 每段按 4 字节对齐
+                padding = b'\0' * (-len(data) % 4)
+                f.write(struct.pack('<Q', len(data)) + data + padding)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str, digest: Optional[bytes] = None) -> Optional['ArtistMatcher']:
+        """
+        mmap 索引文件
+
+        Args:
+            digest: 期望的 artist.py 摘要，不一致时视为过期
+
+        Returns:
+            ArtistMatcher，文件不存在、格式不符或已过期时返回 None
+        """
+        if sys.byteorder != 'little':
+            return None
+        try:
+            with open(path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        header = len(_MAGIC) + 20
+        if buffer[:len(_MAGIC)] != _MAGIC or (digest and buffer[len(_MAGIC):header] != digest):
+            buffer.close()
+            return None
+
+        view = memoryview(buffer)
+        tables: Dict[str, object] = {}
+        offset = header
+        for name in _SECTIONS:
+            (length,) = struct.unpack_from('<Q', buffer, offset)
+            offset += 8
+            section = view[offset:offset + length]
+            tables[name] = section if name.endswith('_blob') else section.cast('I')
+            offset += length + (-length % 4)
+        return cls(tables)
+
+    def _name(self, pattern_id: int) -> str:
+        return bytes(self.name_blob[self.name_offsets[pattern_id]:self.name_offsets[pattern_id + 1]]).decode()
+
+    def label(self, pattern_id: int) -> str:
+        """模式的原始名称"""
+        return bytes(self.label_blob[self.label_offsets[pattern_id]:self.label_offsets[pattern_id + 1]]).decode()
+
+    def lookup(self, name: str) -> Optional[str]:
+        """精确查找（归一化后比较），返回原始名称"""
+        pattern = normalize(name.strip())
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._name(middle) < pattern:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.size and self._name(low) == pattern:
+            return self.label(low)
+        return None
+
+    def __contains__(self, name: str) -> bool:
+        return self.lookup(name) is not None
+
+    def _next(self, state: int, code: int) -> Optional[int]:
+        return _transition(self.child_start, self.char, state, code)
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        找出文本中所有歌手名（可能重叠）
+
+        Args:
+            text: 已归一化的文本
+
+        Returns:
+            [(起始位置, 结束位置, 歌手名), ...]
+        """
+        matches = []
+        state = 0
+        for position, char in enumerate(text):
+            code = ord(char)
+            next_state = self._next(state, code)
+            while next_state is None and state:
+                state = self.fail[state]
+                next_state = self._next(state, code)
+            state = next_state or 0
+
+            for index in range(self.output_start[state], self.output_start[state + 1]):
+                pattern_id = self.output[index]
+                start, end = position + 1 - self.lengths[pattern_id], position + 1
+                # 英文名需要完整的单词，避免 “ADO” 匹配到 “shadow”
+                if _is_word_char(text[start]) and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if _is_word_char(text[end - 1]) and end < len(text) and _is_word_char(text[end]):
+                    continue
+                matches.append((start, end, self.label(pattern_id)))
+        return matches
+
+    def segment(self, text: str) -> Tuple[List[str], str]:
+        """
+        正向最大匹配：从左到右，每个位置取最长的歌手名
+
+        Args:
+            text: 已归一化的文本
+
+        Returns:
+            (歌手列表, 未被匹配的剩余文本)
+        """
+        longest: Dict[int, Tuple[int, str]] = {}
+        for start, end, name in self.find_all(text):
+            if start not in longest or end > longest[start][0]:
+                longest[start] = (end, name)
+
+        artists, rest = [], []
+        position = 0
+        while position < len(text):
+            if position in longest:
+                end, name = longest[position]
+                if name not in artists:
+                    artists.append(name)
+                rest.append(' ')
+                position = end
+            else:
+                rest.append(text[position])
+                position += 1
+        return artists, ''.join(rest)
+
+    def match_artists(self, text: str) -> Optional[List[str]]:
+        """
+        如果文本完全由歌手名和分隔符组成，返回其中的歌手，否则返回 None
+        """
+        # 整段文本恰好是一个歌手名，包括不在自动机中的单字名称（如“信”）
+        exact = self.lookup(text)
+        if exact:
+            return [exact]
+        artists, rest = self.segment(normalize(text))
+        if artists and _SEPARATORS.fullmatch(rest):
+            return artists
+        return None
+
+    def resolve_filename(self, stem: str) -> Optional[Tuple[str, str]]:
+        """
+        从 “歌手 - 标题” 或 “标题 - 歌手” 形式的文件名（不含扩展名）中识别歌手
+
+        Returns:
+            (歌手, 标题)，多个歌手用逗号分隔；无法识别时返回 None
+        """
+        parts = _TITLE_SEPARATOR.split(stem.strip(), maxsplit=1)
+        if len(parts) != 2 or not parts[0] or not parts[1]:
+            return None
+
+        for artist_part, title_part in (parts, parts[::-1]):
+            artists = self.match_artists(artist_part)
+            if artists:
+                return ', '.join(artists), title_part.strip()
+        return None
+
+
+def build_index() -> ArtistMatcher:
+    """从 artist.py 构建并保存 artist.idx"""
+    from artist import ALL
+    matcher = ArtistMatcher.from_names(ALL)
+    digest = _source_digest()
+    if digest:
+        try:
+            matcher.save(ARTIST_INDEX, digest)
+        except OSError as e:
+            print(f'warning: cannot write {ARTIST_INDEX}: {e}', file=sys.stderr)
+    return matcher
+
+
+_default_matcher: Optional[ArtistMatcher] = None
+
+
+def default_matcher() -> ArtistMatcher:
+    """
+    基于 artist.ALL 的匹配器，首次使用时加载 artist.idx；
+    索引不存在或 artist.py 已修改时重新构建
+    """
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = ArtistMatcher.load(ARTIST_INDEX, _source_digest()) or build_index()
+    return _default_matcher
+
+
+if __name__ == '__main__':
+    import time
+
+    if sys.argv[1:] == ['--build']:
+        start = time.perf_counter()
+        matcher = build_index()
+        print(f'built {ARTIST_INDEX} in {time.perf_counter() - start:.2f}s: '
+              f'{matcher.size} names, {len(matcher.fail)} states')
+        sys.exit(0)
+
+    start = time.perf_counter()
+    matcher = default_matcher()
+    print(f'loaded in {(time.perf_counter() - start) * 1000:.1f}ms, {matcher.size} names')
+
+    for name in sys.argv[1:] or ['刘若英_黄韵玲-听！是谁在唱歌', '高明骏陈艾湄-那种心跳的感觉', '双节棍 - 周杰伦']:
+        print(f'{name} => {matcher.resolve_filename(name)}')
@@ -0,0 +1,243 @@
+#! /usr/bin/env python3
+# 脚本需要兼容 Python3.9 (FreeBSD)
+"""
+音乐库整理流水线
+
+代替依次运行 remove-ad.py、classify-artist.py、simplified-chinese.py、del-empty-dir.py：
+只遍历一次目录树，每个文件的标签只读取（和写入）一次。
+
+0. （可选）按音频数据去重，同一录音只保留一个文件，之后的步骤不再处理其余副本
+1. 在进程池中读取标签，删除广告，标签值转为简体，一次保存
+2. 确定歌手：标签 -> 歌手库匹配文件名 -> AI 批量识别
+3. 计算 歌手/专辑/歌手 - 歌名.扩展名 的目标位置
+4. 根据第一次遍历的结果计算移动之后变空的目录，移动和删除作为一个计划统一执行
+
+无法识别歌手的文件保留在原处并列出，不会被删除。
+
+用法：python3 organize-music.py <音乐目录> [--output <目标目录>] [--dry-run]
+"""
+
+import os
+import sys
+import argparse
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# treetools 位于仓库根目录
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from treetools import DEFAULT_WORKERS, TreePlan, make_walker, plan_tree, execute_plan
+from tag import FileMetadata, compile_block_words, process_pool
+from detect import suspect_batch
+from matcher import default_matcher
+from audiohash import find_audio_duplicates
+from library import AUDIO_EXTENSIONS, BLOCK_WORDS, convertible_chars, destination, to_simplified
+
+
+BLOCK_PATTERN = compile_block_words(BLOCK_WORDS)
+TAG_FIELDS = ('artist', 'album', 'title')
+
+# 每次请求包含的文件数，以及同时进行的请求数
+LLM_BATCH_SIZE = 8
+LLM_CONCURRENCY = 2
+
+Walk = List[Tuple[str, List[str], List[str]]]
+
+
+def inspect(path: str, dry_run: bool) -> Tuple[str, Optional[dict], dict, bool, Optional[str]]:
+    """
+    在子进程中处理一个文件的标签：删除广告、转为简体，有修改时保存一次
+
+    Returns:
+        (路径, 处理后的 get_metadata() 结果, 修改内容, 是否重写了整个文件, 错误信息)
+    """
+    try:
+        metadata = FileMetadata(path)
+        with metadata.edit(save=not dry_run):
+            metadata.filter(BLOCK_PATTERN)
+            tags = metadata.get_metadata()
+            simplified = {key: to_simplified(tags[key]) for key in TAG_FIELDS if tags[key]}
+            simplified = {key: value for key, value in simplified.items() if value != tags[key]}
+            if simplified:
+                for key, value in simplified.items():
+                    metadata.changes[key] = (tags[key], value)
+                metadata.set_metadata(simplified)
+                tags.update(simplified)
+        return path, tags, metadata.changes, metadata.rewritten, None
+    except Exception as e:
+        return path, None, {}, False, str(e)
+
+
+def resolve_locally(matcher, path: str, tags: dict) -> Optional[Tuple[str, str]]:
+    """根据标签或文件名确定 (歌手, 歌名)，本地无法确定时返回 None"""
+    artist = tags['artist'].strip()
+    title = tags['title'].strip()
+    if artist and title:
+        return artist, title
+
+    stem = os.path.basename(path).rsplit('.', 1)[0]
+    return matcher.resolve_filename(to_simplified(stem))
+
+
+def replay(walk: Walk, moved: Set[str]):
+    """用第一次遍历的结果代替再次遍历，已计划移走的文件视为不存在"""
+    def walker(_: str) -> Iterable[Tuple[str, List[str], List[str]]]:
+        for dirpath, dirnames, filenames in walk:
+            yield dirpath, dirnames, [name for name in filenames if os.path.join(dirpath, name) not in moved]
+    return walker
+
+
+def plan_library(root: str, output: str, walk: Walk, resolved: Dict[str, Tuple[str, str, str]],
+                 deleted: Set[str]) -> Tuple[TreePlan, List[Tuple[str, str]]]:
+    """
+    生成移动和清理计划
+
+    Args:
+        resolved: {路径: (歌手, 专辑, 歌名)}
+        deleted: 已删除（或预览时将被删除）的文件
+
+    Returns:
+        (计划, 因目标已存在而跳过的 [(路径, 目标路径)])
+    """
+    plan = TreePlan()
+    conflicts = []
+    targets: Set[str] = set()
+    for path, (artist, album, title) in resolved.items():
+        target = destination(output, path, artist, album, title)
+        if os.path.abspath(target) == os.path.abspath(path):
+            continue
+        if target in targets or os.path.lexists(target):
+            conflicts.append((path, target))
+            continue
+        targets.add(target)
+        plan.moves[path] = target
+
+    # 接收文件的目录及其上级目录不能删除
+    keep: Set[str] = set()
+    for target in targets:
+        directory = os.path.dirname(os.path.abspath(target))
+        while directory not in keep and directory != os.path.dirname(directory):
+            keep.add(directory)
+            directory = os.path.dirname(directory)
+
+    pruned = plan_tree(root, flatten=False, prune=True, walker=replay(walk, set(plan.moves) | deleted))
+    plan.removals = [path for path in pruned.removals if os.path.abspath(path) not in keep]
+    plan.empty_dirs = [path for path in pruned.empty_dirs if os.path.abspath(path) not in keep]
+    return plan, conflicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scrub, classify and file a music library in one pass')
+    parser.add_argument('path', help='Path to the music library')
+    parser.add_argument('--output', default=None, help='Library root for the organised files (default: path)')
+    parser.add_argument('--dedupe', action='store_true',
+                        help='Delete copies of the same recording that differ only in tags')
+    parser.add_argument('--dry-run', action='store_true', help='Only show what would change')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes for tag I/O')
+    parser.add_argument('--walk-jobs', type=int, default=DEFAULT_WORKERS, help='Number of concurrent directory reads')
+    parser.add_argument('--index', default=None, help='Walk from an fsindex.py snapshot database')
+    args = parser.parse_args()
+    output = args.output or args.path
+
+    walk: Walk = list(make_walker(args.walk_jobs, args.index)(args.path))
+    files = [os.path.join(dirpath, name) for dirpath, _, filenames in walk
+             for name in filenames if name.lower().endswith(AUDIO_EXTENSIONS)]
+    print(f'{len(files)} audio files found')
+
+    deleted: Set[str] = set()
+    if args.dedupe:
+        groups, _ = find_audio_duplicates(files, args.jobs)
+        for group in groups:
+            for path in group[1:]:
+                print(f'duplicate of {group[0]}: {path}')
+                if not args.dry_run:
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        print(f'error: {e}')
+                        continue
+                deleted.add(path)
+        files = [path for path in files if path not in deleted]
+        action = 'would delete' if args.dry_run else 'deleted'
+        print(f'{action} {len(deleted)} duplicates, {len(files)} files left')
+
+    matcher = default_matcher()
+    # 在 fork 子进程之前建好繁简转换表，子进程直接继承，不必各自重建
+    convertible_chars()
+    resolved: Dict[str, Tuple[str, str, str]] = {}
+    # 本地无法识别的文件，最后统一交给 AI 批量处理: [(路径, 标签)]
+    pending: List[Tuple[str, dict]] = []
+    failed = scrubbed = 0
+    rewritten = []
+
+    with process_pool(args.jobs) as executor:
+        for path, tags, changes, full_rewrite, error in executor.map(
+                inspect, files, [args.dry_run] * len(files), chunksize=16):
+            if error:
+                print(f'file: {path}')
+                print(f'error: {error}')
+                failed += 1
+                continue
+            if changes:
+                scrubbed += 1
+                if full_rewrite:
+                    rewritten.append(path)
+
+            local = resolve_locally(matcher, path, tags)
+            if local:
+                resolved[path] = (local[0], tags['album'].strip(), local[1])
+            else:
+                pending.append((path, tags))
+
+    unresolved = []
+    if pending:
+        print(f'{len(pending)} files need AI to parse')
+        results = suspect_batch([(tags, os.path.basename(path)) for path, tags in pending],
+                                batch_size=LLM_BATCH_SIZE, concurrency=LLM_CONCURRENCY)
+        for (path, tags), answer in zip(pending, results):
+            # 请求失败的文件（answer 为 None）与无法识别的文件一样留在原处
+            answer = answer or {}
+            artist = (answer.get('artist') or '').strip()
+            title = (answer.get('title') or '').strip()
+            if not artist or not title:
+                unresolved.append(path)
+                continue
+            resolved[path] = (to_simplified(artist), tags['album'].strip(), to_simplified(title))
+
+    plan, conflicts = plan_library(args.path, output, walk, resolved, deleted)
+
+    action = 'would update' if args.dry_run else 'updated'
+    print(f'tags: {action} {scrubbed}, {failed} failed')
+    if rewritten:
+        print(f'{len(rewritten)} files outgrew their tag padding and were rewritten in full')
+    for path in unresolved:
+        print(f'unresolved: {path}')
+    for path, target in conflicts:
+        print(f'skip: {path} -> {target} (target already exists)')
+
+    if args.dry_run:
+        for path, target in plan.moves.items():
+            print(f'{path} -> {target}')
+        for path in plan.removals:
+            print(f'would delete empty directory: {path}')
+        print(f'{len(plan.moves)} moves, {len(plan.removals)} directories to delete')
+        return
+
+    for target in {os.path.dirname(target) for target in plan.moves.values()}:
+        os.makedirs(target, exist_ok=True)
+
+    moved = removed_dirs = 0
+    for kind, path, target, error in execute_plan(plan):
+        if kind == 'skip':
+            print(f'skip: {path} -> {target} (target already exists)')
+        elif error:
+            print(f'error: {kind} {path}: {error}')
+        elif kind == 'move':
+            print(f'{path} -> {target}')
+            moved += 1
+        else:
+            print(f'deleting empty directory: {path}')
+            removed_dirs += 1
+    print(f'{moved} files moved, {removed_dirs} directories deleted')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,71 @@
 #! /usr/bin/env python3
 
 import os
-import sys
-from typing import Iterable
-from tag import FileMetadata
+import argparse
+from typing import Iterable, Optional, Tuple
+from tag import FileMetadata, compile_block_words, process_pool
+from library import BLOCK_WORDS, walk_tree
 
 
-BLOCK_WORDS = ['车载', '酷我', '酷狗', 'wx', '排行榜', '无损', '正版', 'www.', '.com', 'qq', '出品', '精品', '3D环绕', '优音', '抖音', '歌曲', '流行', '音樂論壇', '音乐论坛', '收藏']
+BLOCK_PATTERN = compile_block_words(BLOCK_WORDS)
+EXTENSIONS = ('.flac',)
 
 
-def walk_files(path: str) -> Iterable[str]:
-    for (root, _, fs) in os.walk(path):
+def walk_files(path: str, index: Optional[str] = None) -> Iterable[str]:
+    for (root, _, fs) in walk_tree(path, index):
         for f in fs:
             yield os.path.join(root, f)
 
 
+def scrub(path: str, dry_run: bool) -> Tuple[str, dict, bool, Optional[str]]:
+    """
+    在子进程中清理一个文件，只有修改过的文件才会写回
+
+    Returns:
+        (路径, 修改内容, 是否重写了整个文件, 错误信息)
+    """
+    try:
+        metadata = FileMetadata(path)
+        metadata.filter(BLOCK_PATTERN, save=not dry_run)
+        return path, metadata.changes, metadata.rewritten, None
+    except Exception as e:
+        return path, {}, False, str(e)
+
+
+def print_diff(path: str, changes: dict) -> None:
+    print(f'file: {path}')
+    for key, (old, new) in changes.items():
+        print(f'  - {key}: {old}')
+        print(f'  + {key}: {new}')
+
+
 if __name__ == '__main__':
-    INPUT_PATH = sys.argv[1] if len(sys.argv) > 1 else '.'
-
-    for file in walk_files:
-        if not file.endswith('.flac'):
-            continue
-
-        try:
-            metadata = FileMetadata(file)
-            if metadata.filter(BLOCK_WORDS):
-                metadata.print()
-        except Exception as e:
-            print(f'file: {file}')
-            print(f'error: {e}')
-            continue
+    parser = argparse.ArgumentParser(description='Remove ads from audio tags of a whole library')
+    parser.add_argument('path', nargs='?', default='.', help='Path to the music library')
+    parser.add_argument('--dry-run', action='store_true', help='Only show what would change')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--index', default=None, help='Walk from an fsindex.py snapshot database')
+    args = parser.parse_args()
+
+    files = [f for f in walk_files(args.path, args.index) if f.lower().endswith(EXTENSIONS)]
+    modified = failed = 0
+    rewritten = []
+
+    with process_pool(args.jobs) as executor:
+        for path, changes, full_rewrite, error in executor.map(scrub, files, [args.dry_run] * len(files), chunksize=16):
+            if error:
+                print(f'file: {path}')
+                print(f'error: {error}')
+                failed += 1
+            elif changes:
+                print_diff(path, changes)
+                modified += 1
+                if full_rewrite:
+                    rewritten.append(path)
+
+    action = 'would modify' if args.dry_run else 'modified'
+    print(f'{len(files)} files scanned, {action} {modified}, {failed} failed')
+    if rewritten:
+        print(f'{len(rewritten)} files outgrew their tag padding and were rewritten in full:')
+        for path in rewritten:
+            print(f'  {path}')
@@ -2,8 +2,8 @@
 
 import os
 import argparse
-from typing import Iterable
-from zhconv import convert
+from typing import Iterable, Optional, Tuple
+from library import to_simplified, walk_tree
 
 
 DRY_RUN = True
@@ -16,25 +16,40 @@ def rename(old_name: str, new_name: str):
         os.rename(old_name, new_name)
 
 
-def walk_files(path: str) -> Iterable[str]:
-    for (root, _, fs) in os.walk(path):
-        for f in fs:
-            yield os.path.join(root, f)
+def walk_renames(path: str, index: Optional[str] = None) -> Iterable[Tuple[str, str]]:
+    """
+    自底向上列出需要重命名的文件和目录
+
+    目录在其中的所有项目之后才出现，按顺序重命名时，每个路径的上级目录都还是原来的名称。
+
+    Args:
+        index: 快照索引文件（见 fsindex.py）
+
+    Returns:
+        (原路径, 新路径)
+    """
+    for (root, ds, fs) in walk_tree(path, index):
+        for name in fs + ds:
+            new_name = to_simplified(name)
+            if new_name != name:
+                yield os.path.join(root, name), os.path.join(root, new_name)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         prog='convert-to-simplified-chinese.py',
-        description='Convert filenames to simplified Chinese')
-    
+        description='Convert file and directory names to simplified Chinese')
+
     parser.add_argument('path', help='Path to the directory to convert')
     parser.add_argument('--dry-run', action='store_true', help='Don\'t actually rename files')
+    parser.add_argument('--index', default=None, help='Walk from an fsindex.py snapshot database')
 
     args = parser.parse_args()
     PATH = args.path
     DRY_RUN = args.dry_run
 
-    for file in walk_files(PATH):
-        new_name = convert(file, 'zh-cn')
-        if new_name != file:
-            rename(file, new_name)
\ No newline at end of file
+    for old_path, new_path in walk_renames(PATH, args.index):
+        if os.path.lexists(new_path):
+            print(f'skip: {new_path} already exists')
+            continue
+        rename(old_path, new_path)
@@ -2,20 +2,38 @@
 # 脚本需要兼容 Python3.9 (FreeBSD)
 
 import os
-from typing import Union
+import re
+import json
+import sqlite3
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from mutagen import FileType
 from mutagen.flac import FLAC
 from mutagen.mp3 import MP3
 from mutagen.apev2 import APEv2
 
 
+# 图片类型（ID3 / FLAC 通用），3 为封面
+PICTURE_FRONT_COVER = 3
+
+# 标签超出现有 padding、不得不重写整个文件时，预留的 padding 大小，之后的修改可以原地写入
+GENEROUS_PADDING = 64 * 1024
+
+
 class FileMetadata:
     file_path: str = ''
     metadata: FileType = None
     dirty: bool = False
+    # 最近一次保存是否重写了整个文件
+    rewritten: bool = False
+    _in_transaction: bool = False
 
     def __init__(self, file_path: str):
         self.file_path = file_path
+        # filter 造成的修改 {标签: (原值, 新值)}
+        self.changes: Dict[str, Tuple[list, list]] = {}
         if not os.path.isfile(file_path):
             raise Exception('file not found')
 
@@ -42,47 +60,219 @@ class FileMetadata:
             if isinstance(value, str):
                 value = value.split(';')
             self.metadata[key] = value
-        self.metadata.save()
+        self.dirty = True
+        if not self._in_transaction:
+            self._save()
+
+    @contextmanager
+    def edit(self, compact: bool = False, save: bool = True):
+        """
+        事务式修改：期间的 set_metadata、filter 只修改内存，结束时统一保存一次
+
+            with metadata.edit():
+                metadata.filter(BLOCK_WORDS)
+                metadata.set_metadata({'artist': artist})
+            print(metadata.rewritten)
+
+        发生异常时不保存。
+
+        Args:
+            compact: 是否去掉多余的 padding（如删除了大块数据后希望文件变小）
+            save: 是否保存到文件，False 时只修改内存（用于预览）
+        """
+        self._in_transaction = True
+        try:
+            yield self
+        finally:
+            self._in_transaction = False
+        if self.dirty and save:
+            self._save(compact)
 
     def __getitem__(self, key: str) -> Union[str, list]:
         return self.metadata.get(key)
 
-    def _save(self) -> None:
-        self.metadata.save()
+    def _save(self, compact: bool = False) -> None:
+        """
+        保存标签。FLAC/MP3 的标签位于文件头部，只要不超过现有 padding 就能原地写入；
+        超出时 mutagen 必须重写整个文件，此时预留较大的 padding 供之后的修改使用
+        """
+        self.rewritten = False
+        # APEv2 标签位于文件末尾，不涉及 padding
+        if isinstance(self.metadata, APEv2):
+            self.metadata.save()
+            return
 
-    def _filter_one_list(self, lst: list, block_words: list) -> tuple[bool, list]:
-        modified = False
+        def padding(info) -> int:
+            if info.padding < 0:
+                self.rewritten = True
+                return GENEROUS_PADDING
+            if compact and info.padding > GENEROUS_PADDING:
+                self.rewritten = True
+                return GENEROUS_PADDING
+            return info.padding
 
-        for e in lst:
-            for word in block_words:
-                if word in e.lower():
-                    lst.remove(e)
-                    self.dirty = True
-                    modified = True
-                    break
-        return (modified, lst)
+        self.metadata.save(padding=padding)
+
+    def _filter_one_list(self, lst: list, block_pattern: re.Pattern) -> tuple[bool, list]:
+        kept = [e for e in lst if not (isinstance(e, str) and block_pattern.search(e))]
+        return (len(kept) != len(lst), kept)
 
-    def filter(self, block_words: list) -> bool:
-        for (key, value) in self.metadata.items():
+    def filter(self, block_words: Union[list, re.Pattern], save: bool = True) -> bool:
+        """
+        删除包含屏蔽词的标签值，只有确实发生修改时才保存
+
+        Args:
+            block_words: 屏蔽词列表，或 compile_block_words 编译好的模式
+            save: 是否保存到文件，False 时只记录修改（用于预览）
+        """
+        if not isinstance(block_words, re.Pattern):
+            block_words = compile_block_words(block_words)
+
+        for (key, value) in list(self.metadata.items()):
             if isinstance(value, list):
                 flag, new_list = self._filter_one_list(value, block_words)
                 if flag:
+                    self.changes[key] = (value, new_list)
                     self.metadata[key] = new_list
+                    self.dirty = True
 
-        if 'encoded_by' in self.metadata:
+        encoded_by = self.metadata.get('encoded_by')
+        if encoded_by and encoded_by != ['']:
+            self.changes['encoded_by'] = (encoded_by, [''])
             self.metadata['encoded_by'] = ''
             self.dirty = True
 
-        if self.dirty:
+        if self.dirty and save and not self._in_transaction:
             self._save()
         return self.dirty
 
+    def pictures(self) -> List[Tuple[str, int, bytes]]:
+        """内嵌图片 [(MIME 类型, 图片类型, 数据)]"""
+        if isinstance(self.metadata, FLAC):
+            return [(p.mime, p.type, p.data) for p in self.metadata.pictures]
+        if isinstance(self.metadata, MP3):
+            tags = self.metadata.tags
+            return [(f.mime, f.type, f.data) for f in tags.getall('APIC')] if tags else []
+
+        pictures = []
+        for key, value in self.metadata.items():
+            # APEv2 的图片为 文件名\0数据
+            if key.lower().startswith('cover art'):
+                data = value.value.partition(b'\0')[2]
+                picture_type = PICTURE_FRONT_COVER if 'front' in key.lower() else 0
+                pictures.append((_image_mime(data), picture_type, data))
+        return pictures
+
+    def remove_pictures(self) -> None:
+        """删除所有内嵌图片（与 edit(compact=True) 一起使用，文件才会变小）"""
+        if isinstance(self.metadata, FLAC):
+            self.metadata.clear_pictures()
+        elif isinstance(self.metadata, MP3):
+            if self.metadata.tags:
+                self.metadata.tags.delall('APIC')
+        else:
+            for key in [key for key in self.metadata.keys() if key.lower().startswith('cover art')]:
+                del self.metadata[key]
+        self.dirty = True
+
     def print(self) -> None:
         for key in self.metadata:
             print(f'{key}: {self.metadata[key]}')
         print()
 
 
+def _image_mime(data: bytes) -> str:
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    return 'application/octet-stream'
+
+
+def compile_block_words(block_words: Iterable[str]) -> re.Pattern:
+    """将屏蔽词编译为一个模式，每个值只需扫描一遍（忽略大小写）"""
+    return re.compile('|'.join(re.escape(word) for word in block_words), re.IGNORECASE)
+
+
+def process_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """进程池。调用方多是没有 __main__ 保护的脚本，使用 fork 避免子进程重新执行脚本"""
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+TAG_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.tag-cache.sqlite')
+
+
+def _read_one(path: str) -> Tuple[Optional[dict], Optional[str]]:
+    """在子进程中解析一个文件，返回 (get_metadata() 的结果, 错误信息)"""
+    try:
+        return FileMetadata(path).get_metadata(), None
+    except Exception as e:
+        return None, str(e)
+
+
+class TagCache:
+    """以 (路径, 大小, 修改时间) 为键的标签缓存，文件被修改后自动失效"""
+
+    def __init__(self, path: str = TAG_CACHE_PATH):
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS tags ('
+                        'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, metadata TEXT)')
+
+    def get(self, path: str, st: os.stat_result) -> Optional[dict]:
+        row = self.db.execute('SELECT size, mtime_ns, metadata FROM tags WHERE path = ?', (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return json.loads(row[2])
+        return None
+
+    def put(self, path: str, st: os.stat_result, metadata: dict) -> None:
+        self.db.execute('INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?)',
+                        (path, st.st_size, st.st_mtime_ns, json.dumps(metadata, ensure_ascii=False)))
+
+    def commit(self) -> None:
+        self.db.commit()
+
+
+def read_metadata(paths: Iterable[str], workers: Optional[int] = None,
+                  cache: Optional[TagCache] = None) -> Iterator[Tuple[str, Optional[dict], Optional[str]]]:
+    """
+    批量读取标签，按输入顺序逐个返回 (路径, get_metadata() 的结果, 错误信息)
+
+    缓存中未变化的文件不再解析，其余文件在进程池中并行解析。
+
+    Args:
+        paths: 文件路径
+        workers: 进程数，默认为 CPU 核数
+        cache: 标签缓存，默认使用 TAG_CACHE_PATH
+    """
+    cache = cache or TagCache()
+    entries = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            entries.append((path, None, None, str(e)))
+            continue
+        entries.append((path, st, cache.get(path, st), None))
+
+    misses = [path for path, st, cached, error in entries if st and cached is None]
+    with process_pool(workers) as executor:
+        parsed = executor.map(_read_one, misses, chunksize=16)
+        try:
+            for path, st, cached, error in entries:
+                if error:
+                    yield path, None, error
+                elif cached is not None:
+                    yield path, cached, None
+                else:
+                    metadata, error = next(parsed)
+                    if metadata is not None:
+                        cache.put(path, st, metadata)
+                    yield path, metadata, error
+        finally:
+            cache.commit()
+
+
 if __name__ == '__main__':
     file = '/mnt/nas/wd-2T/音乐/flac/周传雄/华语流行排行榜/周传雄 - 我难过.flac'
     metadata = FileMetadata(file)
@@ -2,78 +2,55 @@
 """
 脚本：提取单文件目录中的文件
 功能：遍历指定目录及其子目录，如果某个目录只包含一个文件，则将该文件移动到其父目录中
+      （可选同时删除空目录，见 --prune-empty）
 作者：自动生成
 """
 
 import os
 import sys
-import shutil
-from pathlib import Path
 
+from treetools import DEFAULT_WORKERS, make_walker, plan_tree, execute_plan
 
-def find_single_file_directories(root_path):
+
+def find_single_file_directories(root_path, prune_empty=False, workers=DEFAULT_WORKERS, index_path=None):
     """
     查找只包含单个文件的目录
+
+    嵌套的单文件目录链会逐级向上展开，一次遍历即可得到文件的最终位置。
     
     Args:
         root_path: 根目录路径
+        prune_empty: 是否同时删除空目录
+        workers: 同时读取的目录数，1 表示顺序遍历
+        index_path: 快照索引文件，指定时从索引遍历
         
     Returns:
-        list: 包含 (目录路径, 文件路径) 元组的列表
+        TreePlan: 文件移动和目录删除计划
     """
-    single_file_dirs = []
-    
-    for dirpath, dirnames, filenames in os.walk(root_path):
-        # 跳过根目录本身
-        if dirpath == root_path:
-            continue
-            
-        # 检查当前目录是否只包含一个文件且没有子目录
-        if len(filenames) == 1 and len(dirnames) == 0:
-            file_path = os.path.join(dirpath, filenames[0])
-            single_file_dirs.append((dirpath, file_path))
-    
-    return single_file_dirs
+    return plan_tree(root_path, flatten=True, prune=prune_empty, walker=make_walker(workers, index_path))
 
 
-def move_files(operations):
+def move_files(plan):
     """
     执行文件移动操作
     
     Args:
-        operations: 包含 (源目录, 文件路径) 元组的列表
+        plan: find_single_file_directories 返回的计划
     """
     moved_count = 0
     
-    for dir_path, file_path in operations:
-        try:
-            # 获取文件名
-            filename = os.path.basename(file_path)
-            
-            # 目标路径是源目录的父目录
-            parent_dir = os.path.dirname(dir_path)
-            target_path = os.path.join(parent_dir, filename)
-            
-            # 检查目标文件是否已存在
-            if os.path.exists(target_path):
-                print(f"警告：目标文件已存在，跳过: {target_path}")
-                continue
-            
-            # 移动文件
-            shutil.move(file_path, target_path)
-            print(f"✓ 移动: {file_path} -> {target_path}")
-            
-            # 删除空目录
-            try:
-                os.rmdir(dir_path)
-                print(f"✓ 删除空目录: {dir_path}")
-            except OSError as e:
-                print(f"警告：无法删除目录 {dir_path}: {e}")
-            
+    for action, path, target_path, error in execute_plan(plan):
+        if action == 'skip':
+            print(f"警告：目标文件已存在，跳过: {target_path}")
+        elif action == 'move' and error:
+            print(f"错误：移动文件 {path} 时出错: {error}")
+        elif action == 'move':
+            print(f"✓ 移动: {path} -> {target_path}")
             moved_count += 1
-            
-        except Exception as e:
-            print(f"错误：移动文件 {file_path} 时出错: {e}")
+        elif error:
+            print(f"警告：无法删除目录 {path}: {error}")
+        else:
+            print(f"✓ 删除空目录: {path}")
     
     return moved_count
 
@@ -81,12 +58,33 @@ def move_files(operations):
 def main():
     """主函数"""
     # 检查命令行参数
-    if len(sys.argv) != 2:
-        print("用法: python extract-single-files.py <目录路径>")
+    args = sys.argv[1:]
+    prune_empty = '--prune-empty' in args
+    if prune_empty:
+        args.remove('--prune-empty')
+
+    workers = DEFAULT_WORKERS
+    index_path = None
+    try:
+        if '--jobs' in args:
+            position = args.index('--jobs')
+            workers = int(args[position + 1])
+            del args[position:position + 2]
+        if '--index' in args:
+            position = args.index('--index')
+            index_path = args[position + 1]
+            del args[position:position + 2]
+    except (IndexError, ValueError):
+        args = []
+
+    if len(args) != 1:
+        print("用法: python extract-single-files.py [--prune-empty] [--jobs N] [--index 索引文件] <目录路径>")
         print("示例: python extract-single-files.py /path/to/directory")
+        print(f"      --jobs N  同时读取的目录数（默认 {DEFAULT_WORKERS}，网络挂载可以调大，1 表示顺序遍历）")
+        print("      --index   使用 fsindex.py 的快照索引，只重新读取发生变化的目录")
         sys.exit(1)
     
-    root_directory = sys.argv[1]
+    root_directory = args[0]
     
     # 检查目录是否存在
     if not os.path.exists(root_directory):
@@ -101,22 +99,18 @@ def main():
     print("查找只包含单个文件的子目录...")
     
     # 查找只包含单个文件的目录
-    single_file_dirs = find_single_file_directories(root_directory)
+    plan = find_single_file_directories(root_directory, prune_empty, workers, index_path)
     
-    if not single_file_dirs:
+    if not plan:
         print("未找到只包含单个文件的子目录。")
         return
     
-    print(f"\n找到 {len(single_file_dirs)} 个只包含单个文件的目录:")
+    print(f"\n找到 {len(plan.moves)} 个只包含单个文件的目录:")
     print("-" * 60)
     
-    for i, (dir_path, file_path) in enumerate(single_file_dirs, 1):
-        filename = os.path.basename(file_path)
-        parent_dir = os.path.dirname(dir_path)
-        target_path = os.path.join(parent_dir, filename)
-        
-        print(f"{i:2d}. 目录: {dir_path}")
-        print(f"    文件: {filename}")
+    for i, (file_path, target_path) in enumerate(plan.moves.items(), 1):
+        print(f"{i:2d}. 目录: {os.path.dirname(file_path)}")
+        print(f"    文件: {os.path.basename(file_path)}")
         print(f"    将移动到: {target_path}")
         
         # 检查目标文件是否已存在
@@ -124,6 +118,12 @@ def main():
             print(f"    ⚠️  警告：目标位置已存在同名文件！")
         print()
     
+    if plan.empty_dirs:
+        print(f"将删除 {len(plan.empty_dirs)} 个空目录:")
+        for dir_path in plan.empty_dirs:
+            print(f"    {dir_path}")
+        print()
+    
     # 用户确认
     print("-" * 60)
     try:
@@ -139,7 +139,7 @@ def main():
     print("-" * 60)
     
     # 执行移动操作
-    moved_count = move_files(single_file_dirs)
+    moved_count = move_files(plan)
     
     print("-" * 60)
     print(f"操作完成！成功移动了 {moved_count} 个文件。")
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+重复文件查找与去重
+
+逐级缩小候选范围，大部分文件不需要读取内容：
+1. 按文件大小分组，大小唯一的文件直接排除
+2. 读取文件头部和尾部（mmap）计算部分哈希
+3. 只对部分哈希仍然相同的文件计算完整哈希
+
+哈希计算在线程池中并发进行。确认重复的文件可以只报告，也可以替换为硬链接或 reflink
+（Btrfs/XFS 等支持写时复制的文件系统），替换通过临时文件 + rename 原子完成。
+
+用法：python3 find-duplicates.py [--action report|hardlink|reflink] <目录路径> [<目录路径> ...]
+"""
+
+import os
+import sys
+import mmap
+import fcntl
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from treetools import DEFAULT_WORKERS, make_walker
+
+
+# 部分哈希读取的头部和尾部大小
+PARTIAL_SIZE = 64 * 1024
+FULL_HASH_CHUNK = 1024 * 1024
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+FileKey = Tuple[int, int]  # (st_dev, st_ino)，同一个 inode 的多个路径视为同一个文件
+
+
+def collect_by_size(roots: Iterable[str], min_size: int, workers: int, index_path: Optional[str]
+                    ) -> Dict[Tuple[int, int], Dict[FileKey, List[str]]]:
+    """
+    遍历目录，按 (设备, 大小) 分组
+
+    Returns:
+        {(设备, 大小): {(设备, inode): [路径, ...]}}，只保留至少有两个不同 inode 的组
+    """
+    walker = make_walker(workers, index_path)
+    groups: Dict[Tuple[int, int], Dict[FileKey, List[str]]] = {}
+    for root in roots:
+        for dirpath, _, filenames in walker(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path, follow_symlinks=False)
+                except OSError:
+                    continue
+                # 只处理普通文件，跳过符号链接等
+                if not (st.st_mode & 0o170000 == 0o100000) or st.st_size < min_size:
+                    continue
+                inodes = groups.setdefault((st.st_dev, st.st_size), {})
+                inodes.setdefault((st.st_dev, st.st_ino), []).append(path)
+    return {key: inodes for key, inodes in groups.items() if len(inodes) > 1}
+
+
+def partial_hash(path: str, size: int) -> Optional[bytes]:
+    """头部和尾部的哈希；文件不超过两块时即为完整哈希"""
+    try:
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                digest = hashlib.blake2b(m[:PARTIAL_SIZE])
+                if size > PARTIAL_SIZE:
+                    digest.update(m[max(PARTIAL_SIZE, size - PARTIAL_SIZE):])
+                return digest.digest()
+    except (OSError, ValueError):
+        return None
+
+
+def full_hash(path: str) -> Optional[bytes]:
+    digest = hashlib.blake2b()
+    try:
+        with open(path, 'rb') as f:
+            while chunk := f.read(FULL_HASH_CHUNK):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def _refine(executor: ThreadPoolExecutor, candidates: List[List[List[str]]], hash_function
+            ) -> List[List[List[str]]]:
+    """
+    用 hash_function 细分每一组候选，只保留仍有多个成员的组
+
+    Args:
+        candidates: 候选组列表，每组的成员是同一 inode 的路径列表
+        hash_function: path -> 哈希，返回 None 表示无法读取
+    """
+    paths = [member[0] for group in candidates for member in group]
+    digests = iter(executor.map(hash_function, paths))
+
+    refined = []
+    for group in candidates:
+        buckets: Dict[bytes, List[List[str]]] = {}
+        for member, digest in zip(group, digests):
+            if digest is not None:
+                buckets.setdefault(digest, []).append(member)
+        refined.extend(bucket for bucket in buckets.values() if len(bucket) > 1)
+    return refined
+
+
+def find_duplicates(roots: Iterable[str], min_size: int = 1, workers: int = DEFAULT_WORKERS,
+                    index_path: Optional[str] = None) -> List[Tuple[int, List[List[str]]]]:
+    """
+    查找内容完全相同的文件
+
+    Returns:
+        [(文件大小, [[同一 inode 的路径, ...], ...]), ...]
+    """
+    size_groups = collect_by_size(roots, min_size, workers, index_path)
+    sizes = {}
+    candidates = []
+    for (_, size), inodes in size_groups.items():
+        group = [sorted(paths) for paths in inodes.values()]
+        candidates.append(group)
+        for member in group:
+            sizes[member[0]] = size
+    print(f'大小相同的候选: {sum(len(g) for g in candidates)} 个文件，{len(candidates)} 组')
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        candidates = _refine(executor, candidates, lambda path: partial_hash(path, sizes[path]))
+        print(f'部分哈希相同: {sum(len(g) for g in candidates)} 个文件，{len(candidates)} 组')
+
+        # 不超过两块的文件，部分哈希已经覆盖全部内容
+        small = [g for g in candidates if sizes[g[0][0]] <= 2 * PARTIAL_SIZE]
+        large = [g for g in candidates if sizes[g[0][0]] > 2 * PARTIAL_SIZE]
+        confirmed = small + _refine(executor, large, full_hash)
+
+    result = []
+    for group in confirmed:
+        # 优先保留已有硬链接最多的文件，其次按路径排序
+        group.sort(key=lambda member: (-len(member), member[0]))
+        result.append((sizes[group[0][0]], group))
+    result.sort(key=lambda item: item[0] * (len(item[1]) - 1), reverse=True)
+    return result
+
+
+def _replace_atomically(target: str, make_temp) -> None:
+    """在目标所在目录创建临时文件，再用 rename 原子替换目标"""
+    temp_path = os.path.join(os.path.dirname(target), f'.{os.path.basename(target)}.dedupe-tmp')
+    try:
+        make_temp(temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def hardlink(source: str, target: str) -> None:
+    _replace_atomically(target, lambda temp_path: os.link(source, temp_path))
+
+
+def reflink(source: str, target: str) -> None:
+    def clone(temp_path: str) -> None:
+        with open(source, 'rb') as src, open(temp_path, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        st = os.stat(target)
+        os.chmod(temp_path, st.st_mode & 0o7777)
+        os.utime(temp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    _replace_atomically(target, clone)
+
+
+ACTIONS = {'hardlink': hardlink, 'reflink': reflink}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查找重复文件，并可替换为硬链接或 reflink')
+    parser.add_argument('paths', nargs='+', help='要扫描的目录')
+    parser.add_argument('--action', choices=['report', 'hardlink', 'reflink'], default='report',
+                        help='对重复文件的处理方式（默认只报告）')
+    parser.add_argument('--min-size', type=int, default=1, help='忽略小于该大小（字节）的文件')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_WORKERS, help='并发的目录读取和哈希计算数')
+    parser.add_argument('--index', help='使用 fsindex.py 的快照索引代替遍历')
+    parser.add_argument('--yes', action='store_true', help='不询问，直接执行')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if not os.path.isdir(path):
+            print(f'错误: "{path}" 不是一个目录')
+            sys.exit(1)
+
+    groups = find_duplicates(args.paths, args.min_size, args.jobs, args.index)
+    if not groups:
+        print('没有找到重复文件。')
+        return
+
+    reclaimable = 0
+    for size, group in groups:
+        reclaimable += size * (len(group) - 1)
+        print(f'\n{size} 字节 × {len(group)}:')
+        for i, member in enumerate(group):
+            mark = '保留' if i == 0 else '重复'
+            print(f'  [{mark}] {member[0]}' + (f' （另有 {len(member) - 1} 个硬链接）' if len(member) > 1 else ''))
+    print(f'\n共 {len(groups)} 组重复文件，可释放 {reclaimable / 1024 ** 2:.1f} MiB')
+
+    if args.action == 'report':
+        return
+    if not args.yes:
+        confirm = input(f'\n是否将重复文件替换为 {args.action}？(y/N): ').strip().lower()
+        if confirm not in ['y', 'yes', '是']:
+            print('操作已取消。')
+            return
+
+    replace = ACTIONS[args.action]
+    replaced = 0
+    for _, group in groups:
+        source = group[0][0]
+        for member in group[1:]:
+            for target in member:
+                try:
+                    replace(source, target)
+                    replaced += 1
+                except OSError as e:
+                    print(f'错误: 无法替换 "{target}": {e}')
+    print(f'处理完成，替换了 {replaced} 个文件。')
+
+
+if __name__ == '__main__':
+    main()
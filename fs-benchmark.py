@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+文件系统工具基准测试
+
+生成可复现的合成目录树（默认位于 tmpfs /dev/shm），分别测量
+sanitize-filename.py、extract-single-files.py、remove-empty-folders.py 核心函数的性能，
+输出每秒处理的项目数、峰值内存（RSS）和系统调用次数（需要安装 strace）。
+
+所有工具都以预览模式运行，不会修改目录树，同一棵树可以重复测试。
+
+用法：
+    python3 fs-benchmark.py generate [--depth 5] [--fanout 10] [--files 9] ...
+    python3 fs-benchmark.py run [--root /dev/shm/fs-benchmark] [--tools sanitize,extract,...]
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+import importlib.util
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional
+
+REPO_PATH = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ROOT = '/dev/shm/fs-benchmark' if os.path.isdir('/dev/shm') else os.path.join(tempfile.gettempdir(), 'fs-benchmark')
+
+EMOJIS = ['😀', '🎵', '📚', '🔥', '✨', '🎬', '❤', '☀']
+CJK_CHARS = '的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年同'
+ASCII_WORDS = ['report', 'final', 'music', 'lecture', 'photo', 'draft', 'book', 'notes']
+TAIL_SUFFIXES = [' (z-lib.org)', ' [z-lib.org]', ' (pdfdrive.com)']
+EXTENSIONS = ['.pdf', '.epub', '.mp3', '.flac', '.jpg', '.txt']
+
+
+@dataclass
+class TreeConfig:
+    """合成目录树配置"""
+    depth: int = 5
+    fanout: int = 10
+    files: int = 9              # 非叶子目录和普通叶子目录中的文件数
+    emoji_ratio: float = 0.1    # 名称中含有 emoji 的比例
+    cjk_ratio: float = 0.4      # 名称为中文的比例
+    tail_ratio: float = 0.05    # 名称带有 (z-lib.org) 等尾部字符串的比例
+    single_ratio: float = 0.1   # 叶子目录中只含一个文件的比例
+    empty_ratio: float = 0.1    # 叶子目录中为空的比例
+    seed: int = 42
+
+
+class NameGenerator:
+    def __init__(self, config: TreeConfig, rng: random.Random):
+        self.config = config
+        self.rng = rng
+
+    def make(self, index: int) -> str:
+        rng = self.rng
+        if rng.random() < self.config.cjk_ratio:
+            name = ''.join(rng.choice(CJK_CHARS) for _ in range(rng.randint(2, 8)))
+        else:
+            name = ' '.join(rng.choice(ASCII_WORDS) for _ in range(rng.randint(1, 3)))
+        if rng.random() < self.config.emoji_ratio:
+            position = rng.randint(0, len(name))
+            name = name[:position] + rng.choice(EMOJIS) + name[position:]
+        if rng.random() < self.config.tail_ratio:
+            name += rng.choice(TAIL_SUFFIXES)
+        # 序号保证同一目录中名称不重复
+        return f'{name} {index}'
+
+
+def generate_tree(root: str, config: TreeConfig) -> int:
+    """
+    生成合成目录树，已存在的目录会被删除
+
+    Returns:
+        生成的项目数（文件和目录）
+    """
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    os.makedirs(root)
+
+    rng = random.Random(config.seed)
+    names = NameGenerator(config, rng)
+    count = 0
+
+    def make_files(directory: str, number: int) -> None:
+        nonlocal count
+        for i in range(number):
+            path = os.path.join(directory, names.make(i) + rng.choice(EXTENSIONS))
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o644))
+        count += number
+
+    # 显式栈代替递归
+    stack = [(root, 0)]
+    while stack:
+        directory, depth = stack.pop()
+        if depth == config.depth:
+            roll = rng.random()
+            if roll < config.empty_ratio:
+                continue
+            if roll < config.empty_ratio + config.single_ratio:
+                make_files(directory, 1)
+                continue
+        make_files(directory, config.files)
+        if depth < config.depth:
+            for i in range(config.fanout):
+                child = os.path.join(directory, names.make(i))
+                os.mkdir(child)
+                count += 1
+                stack.append((child, depth + 1))
+
+    with open(os.path.join(root, '.benchmark.json'), 'w') as f:
+        json.dump({'config': asdict(config), 'entries': count}, f, indent=2)
+    return count
+
+
+def _load_script(filename: str):
+    """加载文件名带连字符的脚本"""
+    path = os.path.join(REPO_PATH, filename)
+    spec = importlib.util.spec_from_file_location(filename.replace('-', '_')[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _sanitize(root: str) -> None:
+    _load_script('sanitize-filename.py').process_directory(root, dry_run=True)
+
+
+def _extract(root: str, workers: Optional[int] = None) -> None:
+    module = _load_script('extract-single-files.py')
+    if workers is None:
+        module.find_single_file_directories(root)
+    else:
+        module.find_single_file_directories(root, workers=workers)
+
+
+def _prune(root: str, workers: Optional[int] = None) -> None:
+    from treetools import DEFAULT_WORKERS, make_walker, plan_tree
+    plan_tree(root, flatten=False, prune=True, walker=make_walker(workers or DEFAULT_WORKERS))
+
+
+# 测试项目：名称 -> 核心函数（均为只读的预览模式）
+TOOLS: Dict[str, Callable[[str], None]] = {
+    'sanitize': _sanitize,
+    'extract': _extract,
+    'extract-seq': lambda root: _extract(root, workers=1),
+    'prune': _prune,
+    'prune-seq': lambda root: _prune(root, workers=1),
+}
+
+
+def run_tool(name: str, root: str) -> dict:
+    """在当前进程中运行一个测试项目，返回耗时和峰值内存"""
+    sys.path.insert(0, REPO_PATH)
+    # 工具会逐项打印，测试时丢弃输出
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start = time.perf_counter()
+        TOOLS[name](root)
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    # Linux 下 ru_maxrss 的单位是 KiB
+    return {'seconds': elapsed, 'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def _parse_strace_summary(path: str) -> Optional[int]:
+    """解析 strace -c 输出的 total 行"""
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            # % time, seconds, usecs/call, calls, [errors,] total
+            if fields and fields[-1] == 'total':
+                return int(fields[3])
+    return None
+
+
+def measure(name: str, root: str, entries: int) -> dict:
+    """在子进程中运行测试项目，隔离峰值内存，并在可用时用 strace 统计系统调用"""
+    command = [sys.executable, os.path.abspath(__file__), '_run', name, root]
+    strace = shutil.which('strace')
+    summary_path = None
+    if strace:
+        with tempfile.NamedTemporaryFile(prefix='fs-benchmark-strace-', delete=False) as f:
+            summary_path = f.name
+        # -c 统计模式下的耗时包含 strace 自身开销，计时仍由子进程内部完成
+        command = [strace, '-f', '-c', '-o', summary_path] + command
+
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['syscalls'] = None
+    if summary_path:
+        result['syscalls'] = _parse_strace_summary(summary_path)
+        os.remove(summary_path)
+    result['entries_per_second'] = entries / result['seconds'] if result['seconds'] else 0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文件系统工具基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', help='生成合成目录树')
+    generate.add_argument('--root', default=DEFAULT_ROOT, help=f'目录树位置（默认 {DEFAULT_ROOT}）')
+    defaults = TreeConfig()
+    for key, value in asdict(defaults).items():
+        generate.add_argument(f'--{key.replace("_", "-")}', type=type(value), default=value)
+
+    run = subparsers.add_parser('run', help='运行基准测试')
+    run.add_argument('--root', default=DEFAULT_ROOT, help=f'目录树位置（默认 {DEFAULT_ROOT}）')
+    run.add_argument('--tools', default=','.join(TOOLS), help='逗号分隔的测试项目')
+    run.add_argument('--repeat', type=int, default=1, help='每个项目重复次数，取最快的一次')
+
+    internal = subparsers.add_parser('_run')
+    internal.add_argument('tool', choices=list(TOOLS))
+    internal.add_argument('root')
+
+    args = parser.parse_args()
+
+    if args.command == '_run':
+        print(json.dumps(run_tool(args.tool, args.root)))
+        return
+
+    if args.command == 'generate':
+        config = TreeConfig(**{key: getattr(args, key) for key in asdict(defaults)})
+        start = time.perf_counter()
+        count = generate_tree(args.root, config)
+        print(f'已生成 {count} 个项目，用时 {time.perf_counter() - start:.1f} 秒: {args.root}')
+        return
+
+    info_path = os.path.join(args.root, '.benchmark.json')
+    if not os.path.exists(info_path):
+        print(f'错误: "{args.root}" 不是生成的目录树，请先运行 generate')
+        sys.exit(1)
+    with open(info_path) as f:
+        entries = json.load(f)['entries']
+
+    print(f'目录树: {args.root}（{entries} 个项目）')
+    if not shutil.which('strace'):
+        print('提示: 未找到 strace，不统计系统调用次数')
+    print(f'{"项目":<14}{"耗时(秒)":>10}{"项目/秒":>14}{"峰值RSS(MiB)":>14}{"系统调用":>12}')
+    for name in args.tools.split(','):
+        results: List[dict] = [measure(name, args.root, entries) for _ in range(args.repeat)]
+        best = min(results, key=lambda r: r['seconds'])
+        syscalls = best['syscalls'] if best['syscalls'] is not None else '-'
+        print(f'{name:<14}{best["seconds"]:>10.2f}{best["entries_per_second"]:>14,.0f}'
+              f'{best["peak_rss_kib"] / 1024:>14.1f}{syscalls:>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+文件系统快照索引
+
+将目录树保存在 SQLite 中（路径、类型、大小、修改时间、inode），刷新时只重新读取
+修改时间发生变化的目录，其余目录直接使用快照。目录的修改时间只在其直接子项目被
+创建、删除或重命名时变化，因此未变化的目录只需要一次 stat，不需要 listdir。
+
+注意：文件内容被修改不会改变所在目录的修改时间，未重新读取的目录中文件的大小和
+修改时间可能是旧值；目录结构（有哪些文件和目录）总是最新的。
+
+用法：python3 fsindex.py <索引文件> <目录路径>
+"""
+
+import os
+import sys
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from treetools import DEFAULT_WORKERS
+
+
+TYPE_DIR = 'dir'
+TYPE_FILE = 'file'
+# 指向目录的符号链接：与 os.walk 一致，出现在子目录列表中但不进入
+TYPE_DIR_LINK = 'dirlink'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    path     TEXT PRIMARY KEY,
+    parent   TEXT,
+    name     TEXT NOT NULL,
+    type     TEXT NOT NULL,
+    size     INTEGER,
+    mtime_ns INTEGER,
+    inode    INTEGER,
+    -- 目录：最近一次读取其内容时的修改时间，尚未读取时为 NULL
+    listed_mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+'''
+
+Entry = Tuple[str, str, int, int, int]  # (名称, 类型, 大小, 修改时间, inode)
+
+
+def _stat_directory(path: str) -> Optional[os.stat_result]:
+    try:
+        return os.stat(path, follow_symlinks=False)
+    except OSError:
+        return None
+
+
+def _list_directory(path: str) -> Optional[List[Entry]]:
+    """读取目录内容及每个项目的 stat 信息，无法读取时返回 None"""
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    if entry.is_symlink():
+                        entry_type = TYPE_DIR_LINK if entry.is_dir() else TYPE_FILE
+                    else:
+                        entry_type = TYPE_DIR if entry.is_dir(follow_symlinks=False) else TYPE_FILE
+                except OSError:
+                    continue
+                entries.append((entry.name, entry_type, st.st_size, st.st_mtime_ns, st.st_ino))
+    except OSError:
+        return None
+    return entries
+
+
+def _subtree_range(path: str) -> Tuple[str, str]:
+    """path 下所有项目的路径范围：'/' 的下一个字符是 '0'，可以直接使用主键索引"""
+    prefix = path.rstrip('/') + '/'
+    return prefix, prefix[:-1] + '0'
+
+
+class FsIndex:
+    """目录树的 SQLite 快照"""
+
+    def __init__(self, db_path: str, workers: int = DEFAULT_WORKERS):
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(_SCHEMA)
+        self.workers = max(1, workers)
+        # 最近一次刷新的统计 (检查的目录数, 重新读取的目录数)
+        self.last_refresh = (0, 0)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _delete_subtree(self, path: str, include_self: bool = True) -> None:
+        low, high = _subtree_range(path)
+        self.db.execute('DELETE FROM entries WHERE path >= ? AND path < ?', (low, high))
+        if include_self:
+            self.db.execute('DELETE FROM entries WHERE path = ?', (path,))
+
+    def _update_listing(self, path: str, st: os.stat_result, entries: List[Entry]) -> List[str]:
+        """用新读取的目录内容更新快照，返回需要继续检查的子目录"""
+        old = dict(self.db.execute(
+            'SELECT name, type FROM entries WHERE parent = ?', (path,)).fetchall())
+        new_names = {name for name, *_ in entries}
+
+        for name in old:
+            if name not in new_names:
+                self._delete_subtree(os.path.join(path, name))
+
+        subdirs = []
+        for name, entry_type, size, mtime_ns, inode in entries:
+            child_path = os.path.join(path, name)
+            if old.get(name, entry_type) != entry_type:
+                # 类型发生变化（如目录被同名文件替换），丢弃旧的子树
+                self._delete_subtree(child_path)
+            self.db.execute(
+                'INSERT INTO entries (path, parent, name, type, size, mtime_ns, inode) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (path) DO UPDATE SET '
+                'type = excluded.type, size = excluded.size, '
+                'mtime_ns = excluded.mtime_ns, inode = excluded.inode',
+                (child_path, path, name, entry_type, size, mtime_ns, inode))
+            if entry_type == TYPE_DIR:
+                subdirs.append(child_path)
+
+        # 记录读取之前的修改时间：读取期间发生的变化会在下一次刷新时重新读取
+        self.db.execute(
+            'UPDATE entries SET listed_mtime_ns = ?, mtime_ns = ?, inode = ? WHERE path = ?',
+            (st.st_mtime_ns, st.st_mtime_ns, st.st_ino, path))
+        return subdirs
+
+    def refresh(self, root_path: str) -> None:
+        """
+        增量刷新 root_path 下的快照
+
+        按层检查目录：修改时间或 inode 与上次读取时不同的目录重新读取，
+        其余目录的子目录直接从快照中取得。同一层的 stat 和读取在线程池中并发进行。
+        """
+        root_path = os.path.abspath(root_path)
+        st = _stat_directory(root_path)
+        if st is None or not os.path.isdir(root_path):
+            raise NotADirectoryError(root_path)
+
+        self.db.execute(
+            'INSERT OR IGNORE INTO entries (path, parent, name, type) VALUES (?, NULL, ?, ?)',
+            (root_path, os.path.basename(root_path), TYPE_DIR))
+
+        checked = listed = 0
+        level = [root_path]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while level:
+                checked += len(level)
+                next_level: List[str] = []
+                changed: List[Tuple[str, os.stat_result]] = []
+
+                for path, st in zip(level, executor.map(_stat_directory, level)):
+                    if st is None:
+                        self._delete_subtree(path)
+                        continue
+                    row = self.db.execute(
+                        'SELECT listed_mtime_ns, inode FROM entries WHERE path = ?',
+                        (path,)).fetchone()
+                    if row and row[0] == st.st_mtime_ns and row[1] == st.st_ino:
+                        next_level.extend(child for (child,) in self.db.execute(
+                            'SELECT path FROM entries WHERE parent = ? AND type = ?',
+                            (path, TYPE_DIR)))
+                    else:
+                        changed.append((path, st))
+
+                listings = executor.map(_list_directory, [path for path, _ in changed])
+                for (path, st), entries in zip(changed, listings):
+                    if entries is None:
+                        # 无法读取（权限不足等），保留目录本身，丢弃旧内容
+                        self._delete_subtree(path, include_self=False)
+                        continue
+                    next_level.extend(self._update_listing(path, st, entries))
+                listed += len(changed)
+                level = next_level
+
+        self.db.commit()
+        self.last_refresh = (checked, listed)
+
+    def _children(self, root_path: str) -> Dict[str, List[Tuple[str, str]]]:
+        low, high = _subtree_range(root_path)
+        children: Dict[str, List[Tuple[str, str]]] = {}
+        for parent, name, entry_type in self.db.execute(
+                'SELECT parent, name, type FROM entries WHERE path >= ? AND path < ?', (low, high)):
+            children.setdefault(parent, []).append((name, entry_type))
+        return children
+
+    def walk(self, root_path: str) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """
+        从快照自底向上遍历，接口与 os.walk(topdown=False) 相同（路径为绝对路径），
+        可以直接作为 treetools.plan_tree 的 walker
+        """
+        root_path = os.path.abspath(root_path)
+        children = self._children(root_path)
+
+        # 显式栈实现后序遍历，避免深层目录超出递归限制
+        stack: List[Tuple[str, bool]] = [(root_path, False)]
+        while stack:
+            dirpath, expanded = stack.pop()
+            entries = children.get(dirpath, [])
+            if expanded:
+                dirnames = [name for name, t in entries if t in (TYPE_DIR, TYPE_DIR_LINK)]
+                filenames = [name for name, t in entries if t == TYPE_FILE]
+                yield dirpath, dirnames, filenames
+                continue
+            stack.append((dirpath, True))
+            for name, entry_type in entries:
+                if entry_type == TYPE_DIR:
+                    stack.append((os.path.join(dirpath, name), False))
+
+    def refreshed_walk(self, root_path: str) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """先增量刷新再遍历，用作 walker"""
+        self.refresh(root_path)
+        return self.walk(root_path)
+
+    def files(self, root_path: str) -> Iterator[Tuple[str, int, int, int]]:
+        """root_path 下的所有文件 (路径, 大小, 修改时间, inode)"""
+        low, high = _subtree_range(os.path.abspath(root_path))
+        yield from self.db.execute(
+            'SELECT path, size, mtime_ns, inode FROM entries '
+            'WHERE path >= ? AND path < ? AND type = ?', (low, high, TYPE_FILE))
+
+
+def main():
+    if len(sys.argv) != 3:
+        print('用法: python3 fsindex.py <索引文件> <目录路径>')
+        print('示例: python3 fsindex.py ~/.cache/nas.db /mnt/nas')
+        sys.exit(1)
+
+    db_path, root_path = sys.argv[1], sys.argv[2]
+    index = FsIndex(db_path)
+
+    start = time.monotonic()
+    index.refresh(root_path)
+    checked, listed = index.last_refresh
+    count = total_size = 0
+    for _, size, _, _ in index.files(root_path):
+        count += 1
+        total_size += size or 0
+    print(f'刷新完成，用时 {time.monotonic() - start:.2f} 秒')
+    print(f'检查 {checked} 个目录，重新读取 {listed} 个目录')
+    print(f'共 {count} 个文件，{total_size / 1024 ** 3:.2f} GiB')
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
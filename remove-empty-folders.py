@@ -3,29 +3,33 @@
 import os
 import sys # Import sys module
 
-def remove_empty_folders(path):
+from treetools import DEFAULT_WORKERS, make_walker, plan_tree, execute_plan
+
+def remove_empty_folders(path, workers=DEFAULT_WORKERS, index_path=None):
     """
     Removes all empty folders within the given path.
+    Folders that only contain empty folders are removed as well.
+    Up to `workers` directories are listed concurrently (1 walks sequentially).
+    With `index_path`, the tree is read from an fsindex.py snapshot after an incremental refresh.
     """
     if not os.path.isdir(path):
         print(f"Error: {path} is not a valid directory.")
         return
 
-    # Walk through the directory tree from bottom up
-    for root, dirs, files in os.walk(path, topdown=False):
-        for folder_name in dirs:
-            folder_path = os.path.join(root, folder_name)
-            try:
-                if not os.listdir(folder_path):  # Check if the folder is empty
-                    os.rmdir(folder_path)
-                    print(f"Removed empty folder: {folder_path}")
-            except OSError as e:
-                print(f"Error removing folder {folder_path}: {e}")
+    # Walk through the directory tree from bottom up, once
+    plan = plan_tree(path, flatten=False, prune=True, walker=make_walker(workers, index_path))
+    for _, folder_path, _, error in execute_plan(plan):
+        if error:
+            print(f"Error removing folder {folder_path}: {error}")
+        else:
+            print(f"Removed empty folder: {folder_path}")
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python remove-empty-folders.py <path>")
+        print("Usage: python remove-empty-folders.py <path> [jobs] [index-db]")
         sys.exit(1)
     
     target_path = sys.argv[1]
-    remove_empty_folders(target_path)
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WORKERS
+    index_path = sys.argv[3] if len(sys.argv) > 3 else None
+    remove_empty_folders(target_path, jobs, index_path)
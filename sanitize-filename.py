@@ -11,15 +11,22 @@
 6. 删除文件尾部的特定字符串（如 (z-lib.org)）
 7. 支持自定义清理规则的扩展
 
-用法：python3 sanitize-filename.py <目录路径>
+8. 守护模式：通过 inotify 监视目录树，只清理新建或移入的文件（仅 Linux）
+
+用法：python3 sanitize-filename.py [--watch] [--index 索引文件] <目录路径>
 """
 
 import os
 import sys
 import re
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
 import unicodedata
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 
 class FilenameSanitizer:
@@ -203,13 +210,16 @@ class FilenameSanitizer:
         )
 
 
-def collect_all_items(directory_path: str, recursive: bool = True) -> List[Tuple[Path, str, bool]]:
+def collect_all_items(directory_path: str, recursive: bool = True,
+                      index_path: Optional[str] = None) -> List[Tuple[Path, str, bool]]:
     """
     收集目录中所有需要处理的项目（文件和目录）
     
     Args:
         directory_path: 目录路径
         recursive: 是否递归处理子目录
+        index_path: 快照索引文件（见 fsindex.py），指定时先增量刷新索引，再从索引读取目录树，
+                    只有修改过的目录需要重新读取
         
     Returns:
         项目列表 [(路径对象, 相对路径, 是否为目录), ...]
@@ -218,6 +228,21 @@ def collect_all_items(directory_path: str, recursive: bool = True) -> List[Tuple
     directory = Path(directory_path)
     all_items = []
     
+    if index_path is not None:
+        from fsindex import FsIndex
+        index = FsIndex(index_path)
+        root = os.path.abspath(directory_path)
+        for dirpath, dirnames, filenames in index.refreshed_walk(root):
+            if not recursive and dirpath != root:
+                continue
+            for names, is_directory in ((dirnames, True), (filenames, False)):
+                for name in names:
+                    full_path = os.path.join(dirpath, name)
+                    all_items.append((Path(full_path), os.path.relpath(full_path, root), is_directory))
+        index.close()
+        all_items.sort(key=lambda x: (len(x[1].split('/')), x[1]), reverse=True)
+        return all_items
+    
     def scan_directory(current_dir: Path, base_path: Path):
         """递归扫描目录"""
         try:
@@ -247,7 +272,8 @@ def collect_all_items(directory_path: str, recursive: bool = True) -> List[Tuple
     return all_items
 
 
-def process_directory(directory_path: str, dry_run: bool = False, recursive: bool = True) -> List[Tuple[str, str, str]]:
+def process_directory(directory_path: str, dry_run: bool = False, recursive: bool = True,
+                      index_path: Optional[str] = None) -> List[Tuple[str, str, str]]:
     """
     处理指定目录中的所有文件和子目录
     
@@ -255,6 +281,7 @@ def process_directory(directory_path: str, dry_run: bool = False, recursive: boo
         directory_path: 目录路径
         dry_run: 是否为测试模式（不实际重命名文件）
         recursive: 是否递归处理子目录
+        index_path: 快照索引文件，见 collect_all_items
         
     Returns:
         重命名操作的列表 [(原路径, 新路径, 类型), ...]
@@ -273,49 +300,298 @@ def process_directory(directory_path: str, dry_run: bool = False, recursive: boo
     rename_operations = []
     
     # 收集所有需要处理的项目
-    all_items = collect_all_items(directory_path, recursive)
+    all_items = collect_all_items(directory_path, recursive, index_path)
     
     print(f'扫描完成，共找到 {len(all_items)} 个项目')
     
     # 处理每个项目
     for item_path, relative_path, is_directory in all_items:
-        original_name = item_path.name
-        new_name = sanitizer.sanitize_filename(original_name)
+        operation = rename_item(sanitizer, item_path, is_directory, dry_run)
+        if operation:
+            rename_operations.append(operation)
+    
+    return rename_operations
+
+
+def rename_item(sanitizer: FilenameSanitizer, item_path: Path, is_directory: bool,
+                dry_run: bool = False) -> Optional[Tuple[str, str, str]]:
+    """
+    按清理规则重命名单个文件或目录
+    
+    Args:
+        sanitizer: 文件名清理器
+        item_path: 文件或目录路径
+        is_directory: 是否为目录
+        dry_run: 是否为测试模式（不实际重命名文件）
         
-        # 如果名称发生了变化
-        if original_name != new_name:
-            new_path = item_path.parent / new_name
-            
-            # 检查目标路径是否已存在
-            if new_path.exists():
-                item_type = '目录' if is_directory else '文件'
-                print(f'警告: 目标{item_type} "{new_name}" 已存在，跳过重命名')
+    Returns:
+        重命名操作 (原路径, 新路径, 类型)，名称无需变化或目标已存在时返回 None
+    """
+    original_name = item_path.name
+    new_name = sanitizer.sanitize_filename(original_name)
+    
+    # 名称没有变化
+    if original_name == new_name:
+        return None
+    
+    new_path = item_path.parent / new_name
+    item_type = '目录' if is_directory else '文件'
+    
+    # 检查目标路径是否已存在
+    if new_path.exists():
+        print(f'警告: 目标{item_type} "{new_name}" 已存在，跳过重命名')
+        return None
+    
+    if not dry_run:
+        try:
+            item_path.rename(new_path)
+            print(f'✓ 重命名{item_type}: "{original_name}" -> "{new_name}"')
+        except OSError as e:
+            print(f'错误: 无法重命名{item_type} "{original_name}": {e}')
+    else:
+        print(f'[测试模式] 将重命名{item_type}: "{original_name}" -> "{new_name}"')
+    
+    return (str(item_path), str(new_path), item_type)
+
+
+class DirectoryWatcher:
+    """
+    基于 inotify 的目录监视器（仅 Linux），递归监视目录树中新建和移入的文件
+    
+    直接通过 ctypes 调用 libc，不依赖第三方库。
+    """
+    
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    
+    WATCH_MASK = IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    EVENT_HEADER = struct.Struct('iIII')
+    
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f'inotify_init1 失败: {os.strerror(errno)}')
+        # watch descriptor -> 目录路径
+        self.watches: Dict[int, Path] = {}
+        # 本程序自己重命名的目标路径，随后产生的 IN_MOVED_TO 事件需要忽略
+        self.own_renames: Set[Path] = set()
+    
+    def add_watch(self, directory: Path) -> None:
+        """
+        监视单个目录。对同一个目录重复调用时，inotify 会返回相同的描述符，
+        此时只更新记录的路径（用于目录被移动或重命名后）
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            print(f'警告: 无法监视目录 "{directory}": {os.strerror(errno)}')
+            return
+        self.watches[wd] = directory
+    
+    def add_tree(self, directory: Path) -> None:
+        """递归监视目录及其所有子目录"""
+        self.add_watch(directory)
+        for root, dirs, _ in os.walk(directory):
+            for name in dirs:
+                self.add_watch(Path(root) / name)
+    
+    def rebase(self, old_path: Path, new_path: Path) -> None:
+        """目录被重命名后，更新其自身及所有子目录记录的路径"""
+        for wd, path in self.watches.items():
+            if path == old_path:
+                self.watches[wd] = new_path
+            elif old_path in path.parents:
+                self.watches[wd] = new_path / path.relative_to(old_path)
+    
+    def record_renames(self, operations: List[Tuple[str, str, str]]) -> None:
+        """
+        记录本程序自己完成的重命名，否则目标路径会作为新项目出现在下一批事件中，
+        重命名过的目录会被整体重新扫描一次。目录的监视记录同时更新为新路径。
+        
+        Args:
+            operations: rename_item 返回的重命名操作，按执行顺序排列
+        """
+        for old_path, new_path, item_type in operations:
+            old_path, new_path = Path(old_path), Path(new_path)
+            # 重命名失败，不会产生事件
+            if not os.path.lexists(new_path):
                 continue
+            if item_type == '目录':
+                self.rebase(old_path, new_path)
+                self.own_renames = {new_path / path.relative_to(old_path) if old_path in path.parents else path
+                                    for path in self.own_renames}
+            self.own_renames.add(new_path)
+    
+    def read_events(self, timeout: Optional[float]) -> Optional[List[Tuple[Path, bool]]]:
+        """
+        读取一批事件
+        
+        Args:
+            timeout: 等待事件的最长时间（秒），None 表示一直等待
             
-            item_type = '目录' if is_directory else '文件'
-            rename_operations.append((str(item_path), str(new_path), item_type))
+        Returns:
+            新出现的项目列表 [(路径, 是否为目录), ...]；
+            超时返回空列表，事件队列溢出时返回 None（调用方需要全量扫描）
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        
+        buffer = os.read(self.fd, 64 * 1024)
+        items = []
+        overflow = False
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(buffer, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
             
-            if not dry_run:
-                try:
-                    item_path.rename(new_path)
-                    print(f'✓ 重命名{item_type}: "{original_name}" -> "{new_name}"')
-                except OSError as e:
-                    print(f'错误: 无法重命名{item_type} "{original_name}": {e}')
-            else:
-                print(f'[测试模式] 将重命名{item_type}: "{original_name}" -> "{new_name}"')
+            if mask & self.IN_Q_OVERFLOW:
+                overflow = True
+            elif mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+            elif mask & (self.IN_CREATE | self.IN_MOVED_TO) and wd in self.watches:
+                path = self.watches[wd] / name
+                if mask & self.IN_MOVED_TO and path in self.own_renames:
+                    self.own_renames.discard(path)
+                    continue
+                items.append((path, bool(mask & self.IN_ISDIR)))
+        
+        return None if overflow else items
     
-    return rename_operations
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def process_new_items(sanitizer: FilenameSanitizer, watcher: DirectoryWatcher,
+                      items: Dict[Path, bool]) -> int:
+    """
+    清理一批新出现的文件和目录
+    
+    新目录可能是整体移入的，其内容不会产生事件，因此先递归处理目录内容，
+    再处理目录本身。已被某个新目录覆盖的子项目不会重复处理。
+    
+    Args:
+        sanitizer: 文件名清理器
+        watcher: 目录监视器
+        items: 新出现的项目 {路径: 是否为目录}
+        
+    Returns:
+        重命名的项目数量
+    """
+    new_directories: Set[Path] = {path for path, is_directory in items.items() if is_directory}
+    renamed = 0
+    
+    # 按深度倒序处理，保证先重命名深层项目
+    for path in sorted(items, key=lambda p: len(p.parts), reverse=True):
+        if any(parent in new_directories for parent in path.parents):
+            continue
+        if not path.exists() and not path.is_symlink():
+            continue
+        
+        is_directory = path.is_dir() and not path.is_symlink()
+        if is_directory:
+            watcher.add_tree(path)
+            operations = process_directory(str(path))
+            watcher.record_renames(operations)
+            renamed += len(operations)
+        
+        operation = rename_item(sanitizer, path, is_directory)
+        if operation:
+            renamed += 1
+            watcher.record_renames([operation])
+    
+    return renamed
+
+
+def watch_directory(directory_path: str, settle_time: float = 2.0, max_delay: float = 30.0):
+    """
+    守护模式：持续监视目录树，只清理新建或移入的文件和目录
+    
+    短时间内的大量事件（如解压、批量下载）会合并为一批处理：
+    在 settle_time 秒内没有新事件，或距离第一个事件超过 max_delay 秒时开始处理。
+    
+    Args:
+        directory_path: 目录路径
+        settle_time: 事件静默多久后开始处理（秒）
+        max_delay: 一批事件最长等待时间（秒）
+    """
+    directory = Path(directory_path)
+    if not directory.is_dir():
+        print(f'错误: "{directory_path}" 不是一个目录')
+        return
+    
+    sanitizer = FilenameSanitizer()
+    watcher = DirectoryWatcher()
+    watcher.add_tree(directory)
+    print(f'开始监视目录: {directory_path}（共 {len(watcher.watches)} 个目录）')
+    
+    pending: Dict[Path, bool] = {}
+    first_event_time = 0.0
+    try:
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0.0, min(settle_time, first_event_time + max_delay - time.monotonic()))
+            
+            items = watcher.read_events(timeout)
+            if items is None:
+                # 事件队列溢出，事件已丢失，只能全量扫描一次
+                print('警告: inotify 事件队列溢出，执行一次全量扫描')
+                pending.clear()
+                watcher.own_renames.clear()
+                watcher.add_tree(directory)
+                watcher.record_renames(process_directory(directory_path))
+                continue
+            
+            if items:
+                if not pending:
+                    first_event_time = time.monotonic()
+                pending.update(items)
+                if time.monotonic() - first_event_time < max_delay:
+                    continue
+            
+            if pending:
+                process_new_items(sanitizer, watcher, pending)
+                pending = {}
+    except KeyboardInterrupt:
+        print('\n停止监视。')
+    finally:
+        watcher.close()
 
 
 def main():
     """主函数"""
     # 检查命令行参数
-    if len(sys.argv) != 2:
-        print('用法: python3 sanitize-filename.py <目录路径>')
+    args = sys.argv[1:]
+    if len(args) == 2 and args[0] == '--watch':
+        watch_directory(args[1])
+        return
+    
+    index_path = None
+    if len(args) == 3 and args[0] == '--index':
+        index_path = args.pop(1)
+        args.pop(0)
+    
+    if len(args) != 1:
+        print('用法: python3 sanitize-filename.py [--watch] [--index 索引文件] <目录路径>')
         print('示例: python3 sanitize-filename.py /home/user/downloads')
+        print('      python3 sanitize-filename.py --watch /home/user/downloads  # 守护模式，只处理新文件')
+        print('      python3 sanitize-filename.py --index ~/.cache/nas.db /mnt/nas  # 从快照索引读取目录树')
         sys.exit(1)
     
-    directory_path = sys.argv[1]
+    directory_path = args[0]
     
     print(f'开始处理目录: {directory_path}')
     print('=' * 50)
@@ -323,7 +599,7 @@ def main():
     # 首先运行测试模式，显示将要进行的操作
     print('预览模式 - 将要进行的操作:')
     print('-' * 30)
-    operations = process_directory(directory_path, dry_run=True)
+    operations = process_directory(directory_path, dry_run=True, index_path=index_path)
     
     if not operations:
         print('没有需要重命名的文件。')
@@ -345,7 +621,7 @@ def main():
     # 执行实际重命名
     print('\n执行重命名操作:')
     print('-' * 30)
-    process_directory(directory_path, dry_run=False)
+    process_directory(directory_path, dry_run=False, index_path=index_path)
     print('\n处理完成！')
 
 
@@ -3,15 +3,39 @@
 import os
 import json
 import sys
+import argparse
+import threading
 import requests
 from tqdm import tqdm
-from typing import List, Tuple
-from pprint import pprint
+from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
 
+DEFAULT_CONCURRENCY = 8
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = 30
+MAX_RETRIES = 3
+# 在文件末尾多少字节内查找 %%EOF 等结束标记
+TRAILER_WINDOW = 1024
+
+# 课本 PDF 的两种地址，不同批次上传的课本只有其中一种可用
+PDF_URLS = (
+    'https://r3-ndr.ykt.cbern.com.cn/edu_product/esp/assets_document/{id}.pkg/pdf.pdf',
+    'https://r3-ndr.ykt.cbern.com.cn/edu_product/esp/assets/{id}.pkg/pdf.pdf',
+)
+
 session = requests.Session()
 
 
+def make_session(concurrency: int) -> requests.Session:
+    """连接池大小与并发数一致，所有线程共用 keep-alive 连接"""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_maxsize=concurrency))
+    session.mount('http://', HTTPAdapter(pool_maxsize=concurrency))
+    return session
+
+
 def convert(single_line: dict) -> Tuple[str, str, str, str]:
     return single_line['title'], single_line['path'], single_line['id'], single_line['cover']
 
@@ -39,44 +63,217 @@ def load(path: str) -> List[dict]:
     return dfs(data)
 
 
-def download_to(url: str, path: str, exception: bool = False):
-    # 避免重复下载
-    if os.path.exists(path):
-        return 
+class StatusError(Exception):
+    """服务器返回了 200/206 以外的状态码，换一个地址可能成功"""
+
+
+class IncompleteDownload(Exception):
+    """下载的内容不完整，.part 文件保留，下次从中断处继续"""
+
+
+def is_complete(path: str, ext: str = None) -> bool:
+    """
+    按文件格式检查文件头尾，被中断的下载和旧版本写入的 HTML 错误页都无法通过
+
+    - PDF: 以 %PDF 开头，末尾有 %%EOF（允许之后还有少量空白或其他字节，与常见的 PDF 阅读器一致）
+    - 封面: JPEG（FFD8 开头、FFD9 结尾）或 PNG（有 IEND 块）
+    - 其他文件只要求非空
+
+    Args:
+        ext: 文件格式（如 '.pdf'），默认根据扩展名判断（.part 文件需要显式指定）
+    """
+    ext = ext or os.path.splitext(path)[1].lower()
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            head = file.read(8)
+            file.seek(max(0, size - TRAILER_WINDOW))
+            tail = file.read()
+    except OSError:
+        return False
+
+    if ext == '.pdf':
+        return head.startswith(b'%PDF') and b'%%EOF' in tail
+    if ext in ('.jpg', '.jpeg', '.png'):
+        if head.startswith(b'\xff\xd8'):
+            return b'\xff\xd9' in tail
+        if head.startswith(b'\x89PNG'):
+            return b'IEND' in tail
+        return False
+    return size > 0
+
+
+def fetch(url: str, part_path: str) -> None:
+    """流式下载到 part_path，已有部分内容时用 Range 请求继续，并检查长度"""
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    # 不接受压缩编码：Range 和 Content-Length 都按原始字节计算，压缩后无法比较和续传
+    headers = {'Accept-Encoding': 'identity'}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        content_range = response.headers.get('Content-Range', '')
+        total = content_range.rsplit('/', 1)[-1]
+        total = int(total) if total.isdigit() else None
+        # 上次已经下载完整
+        if response.status_code == 416 and offset:
+            if total == offset:
+                return
+            # 本地文件比服务器上的还长，从头下载
+            os.remove(part_path)
+            raise IncompleteDownload(f'{offset} bytes, {total} on server')
+        if response.status_code == 206 and content_range.startswith(f'bytes {offset}-'):
+            mode = 'ab'
+        elif response.status_code == 200:
+            # 服务器不支持 Range，从头下载
+            mode, offset = 'wb', 0
+            length = response.headers.get('Content-Length', '')
+            total = int(length) if length.isdigit() else None
+        else:
+            raise StatusError(response.status_code)
+
+        with open(part_path, mode) as file:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                file.write(chunk)
+                offset += len(chunk)
+
+    if total is not None and offset != total:
+        raise IncompleteDownload(f'{offset} of {total} bytes')
+
+
+def download_to(url: str, path: str, exception: bool = False) -> bool:
+    """
+    下载到 path：先写入 path.part，校验通过后再重命名
+
+    已有的完整文件会被跳过；不完整或损坏的文件（例如被中断的旧版本写出的 PDF）会重新下载。
+
+    Returns:
+        是否下载成功
+    """
+    if is_complete(path):
+        return True
 
-    response = session.get(url)
-    if response.status_code != 200:
-        print(f'[{response.status_code}] failed to download {url} to {path}', file=sys.stderr)
+    part_path = path + '.part'
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                fetch(url, part_path)
+                break
+            except (requests.RequestException, IncompleteDownload):
+                # 网络中断，立即从已下载的位置继续
+                if attempt == MAX_RETRIES:
+                    raise
+
+        if not is_complete(part_path, os.path.splitext(path)[1].lower()):
+            # 长度正确但内容损坏，下次从头下载
+            os.remove(part_path)
+            raise IncompleteDownload('corrupt file')
+        os.replace(part_path, path)
+        return True
+    except Exception as e:
+        print(f'[{e}] failed to download {url} to {path}', file=sys.stderr)
         if exception:
-            raise Exception('Failed to download')
+            raise
+        return False
+
+
+def directory_of(path: str) -> str:
+    return path.rsplit('/', 2)[0] + '/'
+
+
+class UrlVariants:
+    """
+    记住每一类课本可用的 PDF 地址
 
-    with open(path, 'wb') as file:
-        file.write(response.content)
+    课本 id 都是 UUID，看不出属于哪一种地址；同一版本（同一目录下）的课本是同一批上传的，
+    使用同一种地址。按目录记住上一次成功的地址，下一本先尝试它，省去一次必然失败的请求。
+    """
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._working: Dict[str, int] = {}
 
-def download(data: Tuple[str, str, str, str]):
+    @staticmethod
+    def key(path: str) -> str:
+        return directory_of(path).rsplit('/', 2)[0]
+
+    def order(self, path: str) -> List[int]:
+        with self._lock:
+            first = self._working.get(self.key(path), 0)
+        return [first] + [i for i in range(len(PDF_URLS)) if i != first]
+
+    def worked(self, path: str, index: int) -> None:
+        with self._lock:
+            self._working[self.key(path)] = index
+
+
+def download_cover(data: Tuple[str, str, str, str]):
     title, path, id, cover = data
+    download_to(cover, directory_of(path) + title + '_cover.jpg')
+
 
+def download_pdf(data: Tuple[str, str, str, str], variants: UrlVariants):
+    title, path, id, cover = data
+    target = directory_of(path) + title + '.pdf'
+    if is_complete(target):
+        return
+
+    order = variants.order(path)
+    for index in order:
+        try:
+            download_to(PDF_URLS[index].format(id=id), target, exception=True)
+        except StatusError:
+            # 这一种地址不存在，尝试另一种
+            continue
+        variants.worked(path, index)
+        return
+    raise Exception(f'failed to download {title}')
+
+
+def download(data: Tuple[str, str, str, str], variants: UrlVariants = None):
     # 创建文件夹
-    path_on_disk = path.rsplit('/', 2)[0] + '/'
-    if not os.path.exists(path_on_disk):
-        os.makedirs(path_on_disk)
+    os.makedirs(directory_of(data[1]), exist_ok=True)
 
     # 下载封面
-    download_to(cover, path_on_disk + title + '_cover.jpg')
+    download_cover(data)
 
     # 下载课本
-    try:
-        download_to(f'https://r3-ndr.ykt.cbern.com.cn/edu_product/esp/assets_document/{id}.pkg/pdf.pdf', path_on_disk + title + '.pdf', exception=True)
-    except:
-        download_to(f'https://r3-ndr.ykt.cbern.com.cn/edu_product/esp/assets/{id}.pkg/pdf.pdf', path_on_disk + title + '.pdf')
+    download_pdf(data, variants or UrlVariants())
 
 
 def main():
-    data = load('data.json')
+    global session
+
+    parser = argparse.ArgumentParser(description='下载国家中小学智慧教育平台的教材')
+    parser.add_argument('data', nargs='?', default='data.json')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_CONCURRENCY, help='同时进行的下载数')
+    args = parser.parse_args()
+
+    data = load(args.data)
     print(f'length of data: {len(data)}')
-    for item in tqdm(data):
-        download(item)
+
+    session = make_session(args.jobs)
+    variants = UrlVariants()
+    for item in data:
+        os.makedirs(directory_of(item[1]), exist_ok=True)
+
+    # 封面和课本作为独立的任务，一起在线程池中下载
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = []
+        for item in data:
+            futures.append(executor.submit(download_cover, item))
+            futures.append(executor.submit(download_pdf, item, variants))
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                future.result()
+            except Exception as e:
+                print(e, file=sys.stderr)
+                failed += 1
+
+    if failed:
+        print(f'{failed} downloads failed', file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == '__main__':
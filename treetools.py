@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+目录树维护引擎
+
+extract-single-files.py、remove-empty-folders.py 和 directory-organizing/del-empty-dir.py 共用。
+一次自底向上遍历同时完成：
+1. 单文件目录展开：目录只包含一个文件且没有子目录时，将文件移到父目录并删除该目录
+2. 空目录删除
+
+子目录的处理结果在内存中向上传递：嵌套的单文件目录链、删除子目录后变空的目录，
+都能在同一次遍历中处理，不需要重复运行，也不需要再次 listdir。
+"""
+
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+# 网络挂载（SMB/NFS）上每次 scandir 都是一次往返，默认同时进行的目录读取数
+DEFAULT_WORKERS = 8
+
+# 与 os.walk(topdown=False) 相同的接口：产生 (目录, 子目录名列表, 文件名列表)
+Walker = Callable[[str], Iterable[Tuple[str, List[str], List[str]]]]
+
+
+def bottom_up_walk(root_path: str) -> Iterable[Tuple[str, List[str], List[str]]]:
+    return os.walk(root_path, topdown=False)
+
+
+def _list_directory(dirpath: str) -> Tuple[List[str], List[str], List[str]]:
+    """读取单个目录，返回 (子目录名, 文件名, 需要继续遍历的子目录名)"""
+    dirnames, filenames, subdirs = [], [], []
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirnames.append(entry.name)
+                # 与 os.walk 一致：不进入指向目录的符号链接
+                if not entry.is_symlink():
+                    subdirs.append(entry.name)
+            else:
+                filenames.append(entry.name)
+    return dirnames, filenames, subdirs
+
+
+def parallel_walk(root_path: str, workers: int = DEFAULT_WORKERS
+                  ) -> Iterator[Tuple[str, List[str], List[str]]]:
+    """
+    并发的自底向上遍历，结果与 os.walk(topdown=False) 相同（同级目录之间的顺序除外）
+
+    线程池中同时进行多个目录读取，目录在其所有子目录都产生之后才会产生。
+    与 os.walk 一样，无法读取的目录会被忽略。
+
+    Args:
+        root_path: 根目录路径
+        workers: 同时进行的目录读取数
+    """
+    # 已读取、但仍有子目录未产生的目录 {路径: (子目录名, 文件名, 未完成的子目录数)}
+    waiting: Dict[str, Tuple[List[str], List[str], int]] = {}
+    parents: Dict[str, str] = {}
+
+    def finish(dirpath: str) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """产生一个已完成的目录，并向上级联产生随之完成的祖先目录"""
+        while True:
+            if dirpath in waiting:
+                dirnames, filenames, _ = waiting.pop(dirpath)
+                yield dirpath, dirnames, filenames
+            parent = parents.pop(dirpath, None)
+            if parent is None:
+                return
+            dirnames, filenames, remaining = waiting[parent]
+            waiting[parent] = (dirnames, filenames, remaining - 1)
+            if remaining > 1:
+                return
+            dirpath = parent
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running: Dict[Future, str] = {executor.submit(_list_directory, root_path): root_path}
+        while running:
+            done: Set[Future] = wait(running, return_when=FIRST_COMPLETED)[0]
+            for future in done:
+                dirpath = running.pop(future)
+                try:
+                    dirnames, filenames, subdirs = future.result()
+                except OSError:
+                    yield from finish(dirpath)
+                    continue
+
+                waiting[dirpath] = (dirnames, filenames, len(subdirs))
+                for name in subdirs:
+                    child_path = os.path.join(dirpath, name)
+                    parents[child_path] = dirpath
+                    running[executor.submit(_list_directory, child_path)] = child_path
+                if not subdirs:
+                    yield from finish(dirpath)
+
+
+def make_walker(workers: int, index_path: Optional[str] = None) -> Walker:
+    """
+    选择遍历方式
+
+    Args:
+        workers: 同时读取的目录数，不大于 1 时使用顺序的 os.walk
+        index_path: 快照索引文件（见 fsindex.py），指定时先增量刷新索引，再从索引遍历
+    """
+    if index_path:
+        from fsindex import FsIndex
+        return FsIndex(index_path, workers).refreshed_walk
+    if workers <= 1:
+        return bottom_up_walk
+    return partial(parallel_walk, workers=workers)
+
+
+@dataclass
+class TreePlan:
+    """遍历得到的操作计划"""
+    # 文件移动 {原文件路径: 目标路径}，级联展开时只记录最终位置
+    moves: Dict[str, str] = field(default_factory=dict)
+    # 将被删除的目录，按自底向上的顺序排列
+    removals: List[str] = field(default_factory=list)
+    # removals 中因为为空而被删除的目录（其余是展开后删除的单文件目录）
+    empty_dirs: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.moves or self.removals)
+
+
+@dataclass
+class _DirState:
+    """目录在计划执行后的内容"""
+    files: Dict[str, str]  # {文件名: 原文件路径}
+    remaining_dirs: int
+
+
+def plan_tree(root_path: str, flatten: bool = True, prune: bool = True,
+              walker: Walker = bottom_up_walk) -> TreePlan:
+    """
+    自底向上遍历目录树，生成展开和删除计划（不修改文件系统）
+
+    Args:
+        root_path: 根目录路径，根目录本身不会被展开或删除
+        flatten: 是否展开单文件目录
+        prune: 是否删除空目录
+        walker: 自底向上的遍历函数，接口与 os.walk(topdown=False) 相同
+
+    Returns:
+        TreePlan
+    """
+    plan = TreePlan()
+    states: Dict[str, _DirState] = {}
+
+    for dirpath, dirnames, filenames in walker(root_path):
+        files = {name: os.path.join(dirpath, name) for name in filenames}
+        occupied = set(dirnames)
+        remaining_dirs = 0
+
+        for dirname in dirnames:
+            child_path = os.path.join(dirpath, dirname)
+            # 没有被遍历到的目录（符号链接、无权限等）原样保留
+            child = states.pop(child_path, None)
+            if child is None:
+                remaining_dirs += 1
+                continue
+
+            if prune and not child.files and not child.remaining_dirs:
+                plan.removals.append(child_path)
+                plan.empty_dirs.append(child_path)
+                continue
+
+            if flatten and len(child.files) == 1 and not child.remaining_dirs:
+                name, original_path = next(iter(child.files.items()))
+                # 目标位置已有同名文件或目录时跳过
+                if name not in files and name not in occupied:
+                    files[name] = original_path
+                    plan.moves[original_path] = os.path.join(dirpath, name)
+                    plan.removals.append(child_path)
+                    continue
+
+            remaining_dirs += 1
+
+        states[dirpath] = _DirState(files, remaining_dirs)
+
+    return plan
+
+
+def execute_plan(plan: TreePlan) -> Iterator[Tuple[str, str, Optional[str], Optional[Exception]]]:
+    """
+    执行计划：先移动文件，再自底向上删除目录
+
+    文件系统在预览之后可能发生变化：目标已存在的移动会被跳过，
+    仍不为空的目录删除失败，其上层目录也会随之失败，不会误删内容。
+
+    Yields:
+        (操作类型, 路径, 目标路径, 错误)，操作类型为 'move'、'skip' 或 'rmdir'
+    """
+    for source_path, target_path in plan.moves.items():
+        if os.path.exists(target_path):
+            yield ('skip', source_path, target_path, None)
+            continue
+        try:
+            shutil.move(source_path, target_path)
+            yield ('move', source_path, target_path, None)
+        except OSError as e:
+            yield ('move', source_path, target_path, e)
+
+    for dir_path in plan.removals:
+        try:
+            os.rmdir(dir_path)
+            yield ('rmdir', dir_path, None, None)
+        except OSError as e:
+            yield ('rmdir', dir_path, None, e)